@@ -0,0 +1,37 @@
+import sys
+import time
+from bs4 import BeautifulSoup
+from features.poster import extract_first_result_href, extract_poster_src
+
+# Compares CPU time per IMDb lookup for the old BeautifulSoup/html.parser extraction
+# and the targeted extraction in features/poster.py, using pages saved from IMDb
+# (defaults to the fixture pages in bench_fixtures/):
+#   python bench_poster.py [saved_find_page.html saved_title_page.html [iterations]]
+
+def old_extract(search_page, title_page):
+    result = BeautifulSoup(search_page, 'html.parser').select_one("a.ipc-metadata-list-summary-item__t")
+    img = BeautifulSoup(title_page, 'html.parser').select_one('div[data-testid="hero-media__poster"] img.ipc-image')
+    return result.get('href') if result else None, img.get('src') if img else None
+
+def new_extract(search_page, title_page):
+    return extract_first_result_href(search_page), extract_poster_src(title_page)
+
+def measure(extract, search_page, title_page, iterations):
+    started = time.process_time()
+    for _ in range(iterations): result = extract(search_page, title_page)
+    return (time.process_time() - started) / iterations, result
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2:
+        sys.exit("Usage: python bench_poster.py [<search_page.html> <title_page.html> [iterations]]")
+    search_path, title_path = sys.argv[1:3] if len(sys.argv) > 2 else ("bench_fixtures/imdb_find.html", "bench_fixtures/imdb_title.html")
+    with open(search_path, encoding='utf-8') as f: search_page = f.read()
+    with open(title_path, encoding='utf-8') as f: title_page = f.read()
+    iterations = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    old_time, old_result = measure(old_extract, search_page, title_page, iterations)
+    new_time, new_result = measure(new_extract, search_page, title_page, iterations)
+    print(f"BeautifulSoup (html.parser): {old_time * 1000:.2f} ms CPU per lookup -> {old_result}")
+    print(f"Targeted extraction:         {new_time * 1000:.2f} ms CPU per lookup -> {new_result}")
+    if new_time: print(f"Speed-up: {old_time / new_time:.1f}x")
+    if old_result != new_result: print("WARNING: the two extractors returned different results.")
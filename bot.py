@@ -6,12 +6,24 @@ from pyrogram.errors import FloodWait
 from pyromod import Client
 from aiohttp import web
 from config import Config
-from database.db import get_user, save_file_data, get_owner_db_channel
+from database.db import (
+    get_user, save_file_data, get_owner_db_channel, flush_file_writes, backfill_file_titles, warm_up_db, ensure_indexes, ensure_stats,
+    is_known_file, load_known_files
+)
+from features import cluster
+from features.backup import resume_backup_jobs
+from features.cluster import try_global_notification_lock, finish_ingest_job
+from features.poster import prefetch_poster
+from features.worker_pool import pool
 # FIXED: Importing the correct function name
-from utils.helpers import create_post, get_clean_title_and_year, calculate_title_similarity
+from utils.helpers import create_post, send_post, calculate_title_similarity, FILES_PER_POST, BatchEntry
+from utils.capture import recorder
+from utils.fair_queue import FairQueue
+from utils.log import setup_logging
+from utils.watchdog import watchdog
 
 # Setup logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", handlers=[logging.FileHandler("bot.log"), logging.StreamHandler()])
+setup_logging()
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 logging.getLogger("pyromod").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -28,19 +40,35 @@ async def handle_redirect(request):
 
 class Bot(Client):
     def __init__(self):
-        super().__init__("FinalStorageBot", api_id=Config.API_ID, api_hash=Config.API_HASH, bot_token=Config.BOT_TOKEN, plugins=dict(root="handlers"))
+        session = {'name': "FinalStorageBot"}
+        if Config.CLUSTER_MODE:
+            # Instances must not share one session file and update state. Without a stable
+            # INSTANCE_ID the default one changes every run, so keep the session in memory.
+            session = {'name': f"FinalStorageBot_{Config.INSTANCE_ID}"} if Config.INSTANCE_ID else {'name': f"FinalStorageBot_{cluster.INSTANCE_ID}", 'in_memory': True}
+        super().__init__(**session, api_id=Config.API_ID, api_hash=Config.API_HASH, bot_token=Config.BOT_TOKEN, plugins=dict(root="handlers"))
         self.me = None
         self.owner_db_channel_id = None
         self.web_runner = None
-        self.file_queue = asyncio.Queue()
+        self.file_queue = FairQueue(Config.INGEST_OWNER_WEIGHTS)
         self.open_batches = {}
         self.notification_lock = False
         self.notification_timer = None
+        self.chat_send_slots = {}
+        self.last_arrival = {}
+        self.arrival_gaps = {}
 
     def _reset_notification_lock(self):
         self.notification_lock = False
         logger.info("Global notification lock has been reset.")
 
+    async def _engage_notification_lock(self):
+        if Config.CLUSTER_MODE: return await try_global_notification_lock()
+        if self.notification_lock: return False
+        self.notification_lock = True
+        if self.notification_timer: self.notification_timer.cancel()
+        self.notification_timer = asyncio.get_event_loop().call_later(60, self._reset_notification_lock)
+        return True
+
     async def send_with_protection(self, coro, *args, **kwargs):
         while True:
             try:
@@ -50,85 +78,148 @@ class Bot(Client):
             except Exception as e:
                 logger.error(f"SEND_PROTECTION: An error occurred: {e}"); raise
 
+    async def wait_for_chat_slot(self, chat_id, interval=Config.POST_INTERVAL):
+        """Per-chat rate budget: reserves the next send slot in chat_id, at most one per `interval` seconds."""
+        now = time.monotonic()
+        slot = max(now, self.chat_send_slots.get(chat_id, 0))
+        self.chat_send_slots[chat_id] = slot + interval
+        if slot > now: await asyncio.sleep(slot - now)
+
+    async def send_outbound(self, chat_id, call, interval=Config.POST_INTERVAL):
+        """Runs call(client, send) for a channel send, on a helper bot when the worker pool has any."""
+        if pool: return await pool.run(chat_id, call, interval)
+        await self.wait_for_chat_slot(chat_id, interval)
+        return await call(self, self.send_with_protection)
+
+    async def _copy_to_channel(self, channel_id, source_chat_id, sent_queue):
+        while True:
+            item = await sent_queue.get()
+            if item is None: return
+            message_id, footer = item
+            try:
+                await self.send_outbound(channel_id, lambda client, send: send(client.copy_message, channel_id, source_chat_id, message_id, reply_markup=footer))
+            except Exception as e: logger.error(f"Fan-out copy to {channel_id} failed: {e}")
+
+    async def _fan_out_posts(self, posts_to_send, post_channels):
+        """Sends to the first channel, then copies each sent post to the others concurrently."""
+        first_channel, *other_channels = post_channels
+        queues = {channel_id: asyncio.Queue() for channel_id in other_channels}
+        copiers = [asyncio.create_task(self._copy_to_channel(channel_id, first_channel, queue)) for channel_id, queue in queues.items()]
+        try:
+            for post in posts_to_send:
+                sent = await self.send_outbound(first_channel, lambda client, send: send_post(client, first_channel, post, send=send))
+                if sent:
+                    for queue in queues.values(): queue.put_nowait((sent.id, post[2]))
+        finally:
+            for queue in queues.values(): queue.put_nowait(None)
+            await asyncio.gather(*copiers)
+
     async def _post_batch(self, user_id, batch_data):
         notification_messages = []
         try:
-            messages = batch_data['messages']
-            if not messages: return
+            entries = batch_data['entries']
+            if not entries: return
             user = await get_user(user_id)
             post_channels = user.get('post_channels', [])
             if not user or not post_channels: return
 
-            if not self.notification_lock:
-                self.notification_lock = True
+            if await self._engage_notification_lock():
                 logger.info("Global notification lock engaged. Sending 'coming soon' message.")
                 for channel_id in post_channels:
-                    msg = await self.send_with_protection(self.send_message, channel_id, "<i>✨ New releases are coming...</i>", parse_mode=ParseMode.HTML)
+                    msg = await self.send_outbound(channel_id, lambda client, send: send(client.send_message, channel_id, "<i>✨ New releases are coming...</i>", parse_mode=ParseMode.HTML))
                     if msg: notification_messages.append(msg)
-                
-                if self.notification_timer: self.notification_timer.cancel()
-                self.notification_timer = asyncio.get_event_loop().call_later(60, self._reset_notification_lock)
-
-            posts_to_send = await create_post(self, user_id, messages)
-            for channel_id in post_channels:
-                for post in posts_to_send:
-                    poster, caption, footer = post
-                    if poster: await self.send_with_protection(self.send_photo, channel_id, poster, caption=caption, reply_markup=footer)
-                    else: await self.send_with_protection(self.send_message, channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
-                    await asyncio.sleep(2)
+
+            posts_to_send = await create_post(self, user_id, entries)
+            if Config.POST_FANOUT:
+                await self._fan_out_posts(posts_to_send, post_channels)
+            else:
+                for channel_id in post_channels:
+                    for post in posts_to_send:
+                        await self.send_outbound(channel_id, lambda client, send: send_post(client, channel_id, post, send=send))
         except Exception as e: logger.exception(f"Error posting batch: {e}")
         finally:
             for sent_msg in notification_messages:
                 await self.send_with_protection(sent_msg.delete)
 
+    def _record_arrival(self, user_id):
+        """Tracks a moving average of the gap between an owner's files within an upload burst."""
+        now = time.time()
+        last = self.last_arrival.get(user_id)
+        self.last_arrival[user_id] = now
+        # Longer gaps mean a new upload rather than a slow one, so they don't count.
+        if last is None or now - last > Config.BATCH_QUIET_MAX: return
+        previous = self.arrival_gaps.get(user_id)
+        self.arrival_gaps[user_id] = now - last if previous is None else 0.7 * previous + 0.3 * (now - last)
+
+    def _quiet_period(self, user_id):
+        """How long a batch may sit idle before posting: a few typical gaps for this owner."""
+        gap = self.arrival_gaps.get(user_id)
+        if gap is None: return Config.BATCH_QUIET_MAX
+        return min(Config.BATCH_QUIET_MAX, max(Config.BATCH_QUIET_MIN, gap * Config.BATCH_QUIET_FACTOR))
+
     async def file_processor_worker(self):
         logger.info("File Sorter Worker started.")
         while True:
+            job_id = None
             try:
-                message, user_id = await self.file_queue.get()
+                message, user_id, job_id = await self.file_queue.get()
+                media = getattr(message, message.media.value, None)
+                if media and await is_known_file(user_id, media.file_unique_id):
+                    logger.info(f"Skipping '{media.file_name}' for user {user_id}: already stored.", extra={'sample': True})
+                    continue
                 copied_message = await self.send_with_protection(message.copy, self.owner_db_channel_id)
                 if not copied_message: continue
 
-                await save_file_data(user_id, message, copied_message)
-                
-                media_object = getattr(copied_message, copied_message.media.value, None)
-                if not media_object or not hasattr(media_object, 'file_name'): continue
-                
-                # FIXED: Use the correct function name from helpers.py
-                clean_title, _ = get_clean_title_and_year(media_object.file_name)
-                if not clean_title: continue
+                # A shared ingest job is deleted once this item finishes, so in clustered mode the
+                # record must be durable first, or a crash in between would lose it for good.
+                file_data = await save_file_data(user_id, message, copied_message, wait=job_id is not None)
+                clean_title = file_data['clean_title']
+                if not file_data.get('file_name') or not clean_title: continue
+                entry = BatchEntry.from_message(copied_message, file_data)
+                if not entry: continue
 
+                self._record_arrival(user_id)
                 best_match_id, highest_similarity = None, 0.90
                 self.open_batches.setdefault(user_id, {})
                 for batch_id, data in self.open_batches[user_id].items():
+                    if len(data['entries']) >= FILES_PER_POST: continue  # full, waiting to be posted
                     similarity = calculate_title_similarity(clean_title, data['clean_title'])
                     if similarity > highest_similarity:
                         highest_similarity, best_match_id = similarity, batch_id
                 
                 if best_match_id:
                     batch = self.open_batches[user_id][best_match_id]
-                    batch['messages'].append(copied_message)
+                    batch['entries'].append(entry)
                     batch['last_added'] = time.time()
-                    logger.info(f"Added to batch '{batch['clean_title']}' (Similarity: {highest_similarity:.2f})")
+                    logger.info(f"Added to batch '{batch['clean_title']}' (Similarity: {highest_similarity:.2f})", extra={'sample': True})
                 else:
                     new_batch_id = copied_message.id
                     self.open_batches[user_id][new_batch_id] = {
-                        'clean_title': clean_title, 'messages': [copied_message], 'last_added': time.time()
+                        'clean_title': clean_title, 'entries': [entry], 'last_added': time.time(), 'created_at': time.time()
                     }
-                    logger.info(f"Created new batch for '{clean_title}'")
+                    logger.info(f"Created new batch for '{clean_title}'", extra={'sample': True})
+                    # Look the poster up while the batch waits out its quiet window.
+                    if (await get_user(user_id) or {}).get('show_poster', True): prefetch_poster(clean_title, file_data['year'])
             except Exception as e: logger.exception(f"CRITICAL Error in file_processor_worker: {e}")
-            finally: self.file_queue.task_done()
+            finally:
+                if job_id:
+                    try: await finish_ingest_job(user_id, job_id)
+                    except Exception as e: logger.error(f"Could not complete ingest job {job_id}: {e}")
+                self.file_queue.task_done()
     
     async def batch_finalizer_worker(self):
         logger.info("Batch Finalizer Worker started.")
         while True:
             try:
-                await asyncio.sleep(5)
+                await asyncio.sleep(Config.BATCH_CHECK_INTERVAL)
                 now = time.time()
                 ready_to_pop = {}
                 for user_id, batches in list(self.open_batches.items()):
+                    quiet_period = self._quiet_period(user_id)
                     for batch_id, data in list(batches.items()):
-                        if now - data.get('last_added', now) > 7:
+                        if (len(data['entries']) >= FILES_PER_POST
+                                or now - data.get('created_at', now) > Config.BATCH_MAX_AGE
+                                or now - data.get('last_added', now) > quiet_period):
                             ready_to_pop.setdefault(user_id, []).append(batch_id)
 
                 if not ready_to_pop: continue
@@ -142,10 +233,34 @@ class Bot(Client):
                                 del self.open_batches[user_id]
             except Exception as e: logger.exception(f"Error in batch_finalizer_worker: {e}")
 
+    async def _timed(self, phase, coro, timings):
+        started = time.monotonic()
+        try: return await coro
+        finally: timings[phase] = time.monotonic() - started
+
+    async def _start_web_server(self):
+        app = web.Application()
+        app.router.add_get("/get/{file_unique_id}", handle_redirect)
+        if Config.DL_ENABLED:
+            from features.streaming import handle_download
+            app['bot'] = self
+            app.router.add_get("/dl/{file_unique_id}", handle_download)
+        self.web_runner = web.AppRunner(app)
+        await self.web_runner.setup()
+        await web.TCPSite(self.web_runner, Config.VPS_IP, Config.VPS_PORT).start()
+
     async def start(self):
-        await super().start()
-        self.me = await self.get_me()
-        self.owner_db_channel_id = await get_owner_db_channel()
+        boot, timings = time.monotonic(), {}
+        if Config.LOOP_WATCHDOG: watchdog.start()
+        # Steps that don't need Telegram run alongside the connect.
+        web_server = asyncio.create_task(self._timed("web_server", self._start_web_server(), timings))
+        mongo_warm_up = asyncio.create_task(self._timed("mongo_warm_up", warm_up_db(), timings))
+        owner_db_lookup = asyncio.create_task(self._timed("owner_db_lookup", get_owner_db_channel(), timings))
+        # Stats are rebuilt (first boot only) before any handler or worker can increment them.
+        await self._timed("stats", ensure_stats(), timings)
+        await self._timed("telegram_connect", super().start(), timings)
+        self.me = await self._timed("get_me", self.get_me(), timings)
+        self.owner_db_channel_id, *_ = await asyncio.gather(owner_db_lookup, web_server, mongo_warm_up)
         if self.owner_db_channel_id: logger.info(f"Loaded Owner DB ID [{self.owner_db_channel_id}]")
         else: logger.warning("Owner DB ID not set. Use 'Set Owner DB' as admin.")
         try:
@@ -153,19 +268,34 @@ class Bot(Client):
             logger.info(f"Updated bot username to @{self.me.username}")
         except Exception as e: logger.error(f"Could not write to {Config.BOT_USERNAME_FILE}: {e}")
         
+        if Config.HELPER_BOT_TOKENS: await pool.start(self, Config.HELPER_BOT_TOKENS)
         asyncio.create_task(self.file_processor_worker())
         asyncio.create_task(self.batch_finalizer_worker())
-        
-        app = web.Application()
-        app.router.add_get("/get/{file_unique_id}", handle_redirect)
-        self.web_runner = web.AppRunner(app)
-        await self.web_runner.setup()
-        await web.TCPSite(self.web_runner, Config.VPS_IP, Config.VPS_PORT).start()
+        if Config.CLUSTER_MODE:
+            # The elected leader resumes interrupted backups from its heartbeat.
+            asyncio.create_task(cluster.heartbeat_worker(self))
+            asyncio.create_task(cluster.ingest_claim_worker(self))
+            logger.info(f"Clustered mode enabled as instance {cluster.INSTANCE_ID}.")
+        else:
+            asyncio.create_task(resume_backup_jobs(self))
+        asyncio.create_task(ensure_indexes())
+        asyncio.create_task(backfill_file_titles())
+        asyncio.create_task(load_known_files())
+
+        report = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in timings.items())
+        logger.info(f"Startup timings: {report} (total {time.monotonic() - boot:.2f}s)")
         logger.info(f"Bot @{self.me.username} and all services started successfully.")
 
     async def stop(self, *args):
         logger.info("Stopping bot...");
         if hasattr(self, 'web_runner') and self.web_runner: await self.web_runner.cleanup()
+        await pool.stop()
+        if recorder: await recorder.flush()
+        try: await flush_file_writes()
+        except Exception as e: logger.error(f"Could not flush pending file records on shutdown: {e}")
+        if Config.CLUSTER_MODE:
+            try: await cluster.release_all()
+            except Exception as e: logger.error(f"Could not release cluster leases: {e}")
         await super().stop(); logger.info("Bot stopped.")
 
 if __name__ == "__main__":
@@ -27,5 +27,75 @@ class Config:
     # --- PORT CHANGED TO 4040 AS REQUESTED ---
     VPS_PORT = int(os.environ.get("VPS_PORT", 7071))
     
+    # --- Batching policy (seconds) ---
+    # A batch posts once it has been idle for a few of the owner's typical gaps between files
+    # (clamped to MIN..MAX), once it holds FILES_PER_POST files, or once it is MAX_AGE old.
+    BATCH_QUIET_MIN = float(os.environ.get("BATCH_QUIET_MIN", 2))
+    BATCH_QUIET_MAX = float(os.environ.get("BATCH_QUIET_MAX", 7))
+    BATCH_QUIET_FACTOR = float(os.environ.get("BATCH_QUIET_FACTOR", 3))
+    BATCH_MAX_AGE = float(os.environ.get("BATCH_MAX_AGE", 120))
+    BATCH_CHECK_INTERVAL = float(os.environ.get("BATCH_CHECK_INTERVAL", 1))
+
+    # --- Ingest queue fairness ---
+    # Optional per-owner weights as "owner_id:weight,..." (files taken per round; default 1, must be > 0).
+    INGEST_OWNER_WEIGHTS = {
+        int(owner): float(weight) for owner, weight in
+        (pair.split(":") for pair in os.environ.get("INGEST_OWNER_WEIGHTS", "").split(",") if pair.strip())
+    }
+
+    # --- File record write-behind buffer ---
+    # Upserts are flushed as one bulk write after this many ms, or once this many are pending.
+    FILE_WRITE_FLUSH_MS = int(os.environ.get("FILE_WRITE_FLUSH_MS", 50))
+    FILE_WRITE_BATCH_SIZE = int(os.environ.get("FILE_WRITE_BATCH_SIZE", 500))
+
+    # --- Auto-posting ---
+    # Minimum seconds between two posts in the same channel.
+    POST_INTERVAL = float(os.environ.get("POST_INTERVAL", 2))
+    # Post to the first channel only and copy_message to the others concurrently.
+    POST_FANOUT = os.environ.get("POST_FANOUT", "true").lower() == "true"
+
+    # --- Helper bots for outbound sends ---
+    # Extra bot tokens, comma separated. Each helper must be an admin in the Owner DB and every post channel.
+    HELPER_BOT_TOKENS = [token.strip() for token in os.environ.get("HELPER_BOT_TOKENS", "").split(",") if token.strip()]
+    # A helper that fails this many sends in a row is left out for HELPER_COOLDOWN seconds.
+    HELPER_MAX_FAILURES = int(os.environ.get("HELPER_MAX_FAILURES", 3))
+    HELPER_COOLDOWN = int(os.environ.get("HELPER_COOLDOWN", 300))
+
+    # --- Force-subscribe caching (seconds) ---
+    FSUB_MEMBER_CACHE_TTL = int(os.environ.get("FSUB_MEMBER_CACHE_TTL", 600))
+    FSUB_INVITE_LINK_TTL = int(os.environ.get("FSUB_INVITE_LINK_TTL", 3600))
+
+    # --- Clustered mode (several bot processes sharing MongoDB) ---
+    CLUSTER_MODE = os.environ.get("CLUSTER_MODE", "false").lower() == "true"
+    INSTANCE_ID = os.environ.get("INSTANCE_ID")  # defaults to hostname-pid
+    LEASE_TTL = int(os.environ.get("LEASE_TTL", 30))
+    # How many claimed ingest jobs a process keeps queued locally.
+    INGEST_PREFETCH = int(os.environ.get("INGEST_PREFETCH", 20))
+
+    # --- Event loop watchdog ---
+    LOOP_WATCHDOG = os.environ.get("LOOP_WATCHDOG", "false").lower() == "true"
+    LOOP_STALL_THRESHOLD_MS = int(os.environ.get("LOOP_STALL_THRESHOLD_MS", 100))
+
+    # --- Logging ---
+    LOG_FILE = os.environ.get("LOG_FILE", "bot.log")
+    LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024))
+    LOG_BACKUPS = int(os.environ.get("LOG_BACKUPS", 5))
+    LOG_JSON = os.environ.get("LOG_JSON", "false").lower() == "true"
+    # Per-file info messages allowed per second per logger; the rest are counted and dropped.
+    LOG_SAMPLE_PER_SEC = int(os.environ.get("LOG_SAMPLE_PER_SEC", 5))
+
+    # --- HTTP download endpoint (/dl/{file_unique_id}) ---
+    DL_ENABLED = os.environ.get("DL_ENABLED", "false").lower() == "true"
+    DL_MAX_STREAMS = int(os.environ.get("DL_MAX_STREAMS", 8))
+    DL_CACHE_DIR = os.environ.get("DL_CACHE_DIR", "dl_cache")
+    DL_CACHE_MB = int(os.environ.get("DL_CACHE_MB", 1024))
+    # /dl links are signed and handed out only after a normal delivery, so fsub and shortener still apply.
+    # Set DL_SECRET to the same value on every instance; by default it is derived from BOT_TOKEN.
+    DL_SECRET = os.environ.get("DL_SECRET")
+    DL_LINK_TTL = int(os.environ.get("DL_LINK_TTL", 6 * 3600))
+
+    # --- Traffic capture for replay.py (off unless a path is set) ---
+    CAPTURE_FILE = os.environ.get("CAPTURE_FILE")
+
     # The name of the file that stores your bot's username
     BOT_USERNAME_FILE = "bot_username.txt"
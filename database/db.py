@@ -1,5 +1,16 @@
+import asyncio
+import logging
+import time
+from collections import deque, Counter
+from datetime import datetime, timedelta, timezone
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from config import Config
+from utils.bloom import BloomFilter
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 client = AsyncIOMotorClient(Config.MONGO_URI)
 db = client[Config.DATABASE_NAME]
@@ -7,6 +18,117 @@ db = client[Config.DATABASE_NAME]
 users = db['users']
 files = db['files']
 bot_settings = db['bot_settings']
+poster_cache = db['poster_cache']
+backup_jobs = db['backup_jobs']
+leases = db['leases']
+ingest_jobs = db['ingest_jobs']
+owner_stats = db['owner_stats']
+
+class FileWriteBuffer:
+    """Write-behind buffer that coalesces file upserts into one unordered bulk_write."""
+    def __init__(self, collection, max_docs, max_delay, on_inserted=None, on_written=None):
+        self.collection = collection
+        self.on_inserted = on_inserted
+        self.on_written = on_written
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.pending = {}
+        self.waiters = []
+        self.timer = None
+        self.in_flight = set()
+        # Keys in a bulk write that hasn't finished yet, counted in case a key is in two at once.
+        self.writing = Counter()
+
+    def add(self, key, fields):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        # Later writes for the same file in one window are merged, so the bulk never upserts a key twice.
+        self.pending.setdefault(key, {}).update(fields)
+        self.waiters.append(future)
+        if len(self.pending) >= self.max_docs:
+            asyncio.create_task(self.flush())
+        elif not self.timer:
+            self.timer = loop.call_later(self.max_delay, lambda: asyncio.create_task(self.flush()))
+        return future
+
+    async def flush(self):
+        """Writes what is buffered and waits for every write still in flight, so shutdown loses nothing."""
+        if self.timer: self.timer.cancel(); self.timer = None
+        if self.pending:
+            self.writing.update(self.pending.keys())
+            task = asyncio.create_task(self._write(self.pending, self.waiters))
+            self.pending, self.waiters = {}, []
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+        if self.in_flight: await asyncio.gather(*self.in_flight, return_exceptions=True)
+
+    async def _write(self, pending, waiters):
+        ops = [UpdateOne({'owner_id': owner_id, 'file_unique_id': file_unique_id}, {'$set': fields}, upsert=True)
+               for (owner_id, file_unique_id), fields in pending.items()]
+        error, upserted, failed = None, [], set()
+        try:
+            try:
+                result = await self.collection.bulk_write(ops, ordered=False)
+                upserted = list(result.upserted_ids)
+            except Exception as e:
+                error = e
+                if isinstance(e, BulkWriteError):
+                    upserted = [u['index'] for u in e.details.get('upserted', [])]
+                    failed = {w['index'] for w in e.details.get('writeErrors', [])}
+                else: failed = set(range(len(ops)))
+                logger.error(f"Bulk write of {len(ops)} file records failed: {e}")
+            if self.on_written:
+                self.on_written([key for i, key in enumerate(pending) if i not in failed])
+        finally:
+            # Only now are the written keys in the dedup filter, so they stop counting as in flight.
+            self.writing.subtract(pending.keys())
+            for key in pending:
+                if self.writing[key] <= 0: del self.writing[key]
+        if upserted and self.on_inserted:
+            records = list(pending.values())
+            try: await self.on_inserted([records[i] for i in upserted])
+            except Exception as e: logger.error(f"Could not update stats for new file records: {e}")
+        for future in waiters:
+            if future.done(): continue
+            if error: future.set_exception(error)
+            else: future.set_result(True)
+
+# Bloom filter of every stored (owner_id, file_unique_id), so re-posted files can skip the copy.
+# A miss means the file is new; a hit is confirmed against Mongo. Built by load_known_files.
+_known_files = None
+_known_files_loaded = False
+
+# Hot file records joined with their owner's settings, for the deep-link delivery path.
+_delivery_cache = TTLCache(ttl=60, maxsize=2048)
+
+STATS_ID = 'stats'
+# Timestamps of recent saves in this process, for the ingest rate shown in /stats.
+_recent_ingests = deque(maxlen=100000)
+
+async def _record_new_files(records):
+    """Adds newly inserted file records to the materialized stats."""
+    per_owner = {}
+    for record in records:
+        count, size = per_owner.get(record['owner_id'], (0, 0))
+        per_owner[record['owner_id']] = (count + 1, size + (record.get('file_size') or 0))
+    await owner_stats.bulk_write([
+        UpdateOne({'_id': owner_id}, {'$inc': {'files': count, 'bytes': size}}, upsert=True)
+        for owner_id, (count, size) in per_owner.items()
+    ], ordered=False)
+    await bot_settings.update_one({'_id': STATS_ID}, {'$inc': {
+        'total_files': sum(c for c, _ in per_owner.values()), 'total_bytes': sum(b for _, b in per_owner.values())
+    }}, upsert=True)
+
+def _known_file_key(owner_id, file_unique_id):
+    return f"{owner_id}:{file_unique_id}"
+
+def _remember_files(keys):
+    """Adds durably written files to the dedup filter."""
+    if _known_files is None: return
+    for owner_id, file_unique_id in keys: _known_files.add(_known_file_key(owner_id, file_unique_id))
+
+file_writes = FileWriteBuffer(files, Config.FILE_WRITE_BATCH_SIZE, Config.FILE_WRITE_FLUSH_MS / 1000,
+                              on_inserted=_record_new_files, on_written=_remember_files)
 
 async def add_user(user_id):
     """Adds a new user to the database if they don't already exist."""
@@ -23,9 +145,31 @@ async def add_user(user_id):
         'shortener_enabled': True,
         'how_to_download_link': None
     }
-    await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data}, upsert=True)
+    result = await users.update_one({'user_id': user_id}, {"$setOnInsert": user_data}, upsert=True)
+    if result.upserted_id is not None:
+        await bot_settings.update_one({'_id': STATS_ID}, {'$inc': {'total_users': 1}}, upsert=True)
 
 # (The rest of the file is unchanged, providing for completeness)
+async def warm_up_db():
+    """Opens the connection pool before the first request needs it."""
+    await client.admin.command('ping')
+
+async def ensure_indexes():
+    """
+    Creates the indexes the hot paths rely on. Runs in the background: a first build on a big
+    collection can take a while, and a clash with an existing index is logged instead of fatal.
+    """
+    specs = [
+        (users, 'user_id'),
+        (files, 'file_unique_id'),
+        (files, [('owner_id', 1), ('file_unique_id', 1)]),
+        (files, [('owner_id', 1), ('clean_title', 1), ('_id', 1)]),
+        (ingest_jobs, [('owner_id', 1), ('created_at', 1)])
+    ]
+    results = await asyncio.gather(*(collection.create_index(keys) for collection, keys in specs), return_exceptions=True)
+    for (collection, keys), result in zip(specs, results):
+        if isinstance(result, Exception): logger.error(f"Could not create index {keys} on {collection.name}: {result}")
+
 async def set_owner_db_channel(channel_id: int):
     await bot_settings.update_one({'_id': 'owner_db_config'}, {'$set': {'channel_id': channel_id}}, upsert=True)
 
@@ -33,8 +177,9 @@ async def get_owner_db_channel():
     config = await bot_settings.find_one({'_id': 'owner_db_config'})
     return config.get('channel_id') if config else None
 
-async def save_file_data(owner_id, original_message, copied_message):
-    from utils.helpers import get_file_raw_link
+async def save_file_data(owner_id, original_message, copied_message, wait=False):
+    """Queues the file record for the next bulk flush. Pass wait=True to block until it is durable."""
+    from utils.helpers import get_file_raw_link, get_file_title_fields
     original_media = getattr(original_message, original_message.media.value)
     raw_link = await get_file_raw_link(copied_message)
     file_data = {
@@ -43,12 +188,71 @@ async def save_file_data(owner_id, original_message, copied_message):
         'file_id': copied_message.id,
         'file_name': original_media.file_name,
         'file_size': original_media.file_size,
-        'raw_link': raw_link
+        'raw_link': raw_link,
+        **get_file_title_fields(original_media.file_name)
     }
-    await files.update_one(
-        {'owner_id': owner_id, 'file_unique_id': original_media.file_unique_id},
-        {'$set': file_data}, upsert=True
-    )
+    _recent_ingests.append(time.time())
+    future = file_writes.add((owner_id, original_media.file_unique_id), file_data)
+    if wait: await future
+    # Failures are already logged by the flush; mark them retrieved so asyncio doesn't warn again.
+    else: future.add_done_callback(lambda f: f.cancelled() or f.exception())
+    return file_data
+
+async def load_known_files():
+    """Builds the dedup filter from the files collection, sized for twice its current count."""
+    global _known_files, _known_files_loaded
+    _known_files = BloomFilter(max(1_000_000, 2 * await files.estimated_document_count()))
+    async for doc in files.find({}, {'_id': 0, 'owner_id': 1, 'file_unique_id': 1}).batch_size(5000):
+        _known_files.add(_known_file_key(doc.get('owner_id'), doc.get('file_unique_id')))
+    _known_files_loaded = True
+    logger.info(f"Loaded {_known_files.count} known files for dedup ({len(_known_files.bits) // 1024} KB filter).")
+
+async def is_known_file(owner_id, file_unique_id):
+    key = (owner_id, file_unique_id)
+    if key in file_writes.pending or key in file_writes.writing: return True
+    if _known_files_loaded and _known_file_key(owner_id, file_unique_id) not in _known_files: return False
+    # A filter hit may be a false positive, and before the filter is loaded we know nothing: ask Mongo.
+    return await files.find_one({'owner_id': owner_id, 'file_unique_id': file_unique_id}, {'_id': 1}) is not None
+
+async def backfill_file_titles(batch_size=500):
+    """
+    One-off migration: adds the canonical title fields to file records saved before they existed.
+    Walks the collection by _id and records its progress, so it resumes and then never scans again.
+    """
+    from utils.helpers import get_file_title_fields
+    state = await bot_settings.find_one({'_id': 'title_backfill'}) or {}
+    if state.get('done'): return 0
+    after_id, updated = state.get('after_id'), 0
+    while True:
+        query = {'_id': {'$gt': after_id}} if after_id is not None else {}
+        docs = await files.find(query, {'file_name': 1, 'sort_key': 1}).sort('_id', 1).limit(batch_size).to_list(length=batch_size)
+        if not docs: break
+        after_id = docs[-1]['_id']
+        ops = [UpdateOne({'_id': doc['_id']}, {'$set': get_file_title_fields(doc.get('file_name'))}) for doc in docs if 'sort_key' not in doc]
+        if ops: await files.bulk_write(ops, ordered=False)
+        updated += len(ops)
+        await bot_settings.update_one({'_id': 'title_backfill'}, {'$set': {'after_id': after_id}}, upsert=True)
+        await asyncio.sleep(0)
+    await bot_settings.update_one({'_id': 'title_backfill'}, {'$set': {'done': True}}, upsert=True)
+    if updated: logger.info(f"Backfilled title fields on {updated} file records.")
+    return updated
+
+async def is_title_backfill_done():
+    state = await bot_settings.find_one({'_id': 'title_backfill'}, {'done': 1})
+    return bool(state and state.get('done'))
+
+async def flush_file_writes():
+    await file_writes.flush()
+
+async def get_poster_file_id(poster_id):
+    doc = await poster_cache.find_one({'_id': poster_id})
+    return doc.get('file_id') if doc else None
+
+async def save_poster_file_id(poster_id, file_id):
+    await poster_cache.update_one({'_id': poster_id}, {'$set': {'file_id': file_id}}, upsert=True)
+
+async def delete_poster_file_id(poster_id):
+    await poster_cache.delete_one({'_id': poster_id})
 
 async def get_user(user_id):
     return await users.find_one({'user_id': user_id})
@@ -77,13 +281,29 @@ async def get_storage_owners_count():
     return await users.count_documents(query)
 
 async def update_user(user_id, key, value):
+    _delivery_cache.clear()
     await users.update_one({'user_id': user_id}, {'$set': {key: value}}, upsert=True)
 
+CHANNEL_LISTS = ('post_channels', 'db_channels')
+
+def _is_storage_owner(user):
+    return bool(user) and any(user.get(name) for name in CHANNEL_LISTS)
+
+async def _update_channel_list(user_id, list_name, item, add):
+    update = {'$addToSet' if add else '$pull': {list_name: item}}
+    before = await users.find_one_and_update({'user_id': user_id}, update, projection={name: 1 for name in CHANNEL_LISTS})
+    if list_name not in CHANNEL_LISTS or not before: return
+    # Derived from the atomic before-image, so a concurrent update can't skew the count.
+    remaining = [x for x in before.get(list_name) or [] if x != item]
+    after = {**before, list_name: remaining + [item] if add else remaining}
+    change = int(_is_storage_owner(after)) - int(_is_storage_owner(before))
+    if change: await bot_settings.update_one({'_id': STATS_ID}, {'$inc': {'storage_owners': change}}, upsert=True)
+
 async def add_to_list(user_id, list_name, item):
-    await users.update_one({'user_id': user_id}, {'$addToSet': {list_name: item}})
+    await _update_channel_list(user_id, list_name, item, add=True)
 
 async def remove_from_list(user_id, list_name, item):
-    await users.update_one({'user_id': user_id}, {'$pull': {list_name: item}})
+    await _update_channel_list(user_id, list_name, item, add=False)
 
 async def find_owner_by_db_channel(channel_id):
     user = await users.find_one({'db_channels': channel_id})
@@ -92,28 +312,174 @@ async def find_owner_by_db_channel(channel_id):
 async def get_file_by_unique_id(file_unique_id: str):
     return await files.find_one({'file_unique_id': file_unique_id})
 
+async def get_file_with_owner(file_unique_id: str):
+    """Returns (file_data, owner_settings) in one round trip, served from cache for hot files."""
+    cached = _delivery_cache.get(file_unique_id)
+    if cached: return cached
+    pipeline = [
+        {'$match': {'file_unique_id': file_unique_id}},
+        {'$limit': 1},
+        {'$lookup': {'from': users.name, 'localField': 'owner_id', 'foreignField': 'user_id', 'as': 'owner'}}
+    ]
+    docs = await files.aggregate(pipeline).to_list(length=1)
+    if not docs: return None, None
+    file_data = docs[0]
+    owners = file_data.pop('owner', [])
+    result = (file_data, owners[0] if owners else {})
+    _delivery_cache.set(file_unique_id, result)
+    return result
+
 async def get_user_file_count(owner_id):
     return await files.count_documents({'owner_id': owner_id})
 
 async def get_all_user_files(user_id):
     return files.find({'owner_id': user_id})
 
+async def get_backup_files(user_id, after=None, limit=500):
+    """
+    One page of a user's files ordered by stored clean_title, continuing after `after`. Pages are read
+    in full, so no cursor stays open (and times out) while a backup posts them.
+    """
+    # Records without a title yet (backfill_file_titles adds it) can't be grouped or paged past.
+    query = {'owner_id': user_id, 'clean_title': {'$type': 'string'}, 'file_name': {'$type': 'string'}}
+    # Checkpoints from before titles were stored hold a file_name position, which doesn't apply here.
+    if after and 'clean_title' in after:
+        query['$or'] = [{'clean_title': {'$gt': after['clean_title']}}, {'clean_title': after['clean_title'], '_id': {'$gt': after['_id']}}]
+    projection = {'file_name': 1, 'raw_link': 1, 'clean_title': 1, 'year': 1, 'sort_key': 1, 'label': 1}
+    return await files.find(query, projection).sort([('clean_title', 1), ('_id', 1)]).limit(limit).to_list(length=limit)
+
+async def get_backup_job(user_id):
+    return await backup_jobs.find_one({'_id': user_id})
+
+async def start_backup_job(user_id, channel_id):
+    job = {'_id': user_id, 'channel_id': channel_id, 'after': None, 'groups_done': 0, 'files_done': 0}
+    await backup_jobs.replace_one({'_id': user_id}, job, upsert=True)
+    return job
+
+async def save_backup_checkpoint(user_id, after, groups_done, files_done):
+    """Saves progress and returns the job, so a cancel requested from another process is seen."""
+    return await backup_jobs.find_one_and_update(
+        {'_id': user_id}, {'$set': {'after': after, 'groups_done': groups_done, 'files_done': files_done}},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def request_backup_cancel(user_id):
+    result = await backup_jobs.update_one({'_id': user_id}, {'$set': {'cancelled': True}})
+    return result.matched_count > 0
+
+async def finish_backup_job(user_id):
+    await backup_jobs.delete_one({'_id': user_id})
+
+async def set_backup_failed(user_id, failed=True):
+    """Flags a job that stopped on an error, so it is only resumed when the user starts it again."""
+    await backup_jobs.update_one({'_id': user_id}, {'$set': {'failed': failed}})
+
+async def get_running_backup_jobs():
+    """Jobs interrupted by a process exiting: not cancelled and not stopped by an error."""
+    return await backup_jobs.find({'cancelled': {'$ne': True}, 'failed': {'$ne': True}}).to_list(length=None)
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+async def acquire_lease(name, holder, ttl, reentrant=True):
+    """
+    Takes or renews the named lease for `ttl` seconds. Returns False if another holder has it.
+    With reentrant=False the lease is only taken once it has expired, even for its current holder.
+    """
+    now = _utcnow()
+    free = {'expires_at': {'$lt': now}}
+    query = {'_id': name, '$or': [{'holder': holder}, free]} if reentrant else {'_id': name, **free}
+    try:
+        await leases.update_one(query, {'$set': {'holder': holder, 'expires_at': now + timedelta(seconds=ttl)}}, upsert=True)
+        return True
+    except DuplicateKeyError:
+        return False
+
+async def release_lease(name, holder):
+    await leases.delete_one({'_id': name, 'holder': holder})
+
+async def enqueue_ingest_job(owner_id, chat_id, message_id):
+    """Queues a file for the cluster. Every process may see the same update, so the ID dedups it."""
+    job = {'_id': f"{chat_id}:{message_id}", 'owner_id': owner_id, 'chat_id': chat_id, 'message_id': message_id,
+           'claimed_by': None, 'lease_until': None, 'created_at': _utcnow()}
+    try: await ingest_jobs.insert_one(job)
+    except DuplicateKeyError: pass
+
+def _claimable_ingest_query():
+    return {'$or': [{'claimed_by': None}, {'lease_until': {'$lt': _utcnow()}}]}
+
+async def get_claimable_ingest_owners():
+    return await ingest_jobs.distinct('owner_id', _claimable_ingest_query())
+
+async def claim_ingest_job(owner_id, holder, ttl):
+    return await ingest_jobs.find_one_and_update(
+        {'owner_id': owner_id, **_claimable_ingest_query()},
+        {'$set': {'claimed_by': holder, 'lease_until': _utcnow() + timedelta(seconds=ttl)}},
+        sort=[('created_at', 1)], return_document=ReturnDocument.AFTER
+    )
+
+async def renew_ingest_jobs(holder, ttl):
+    await ingest_jobs.update_many({'claimed_by': holder}, {'$set': {'lease_until': _utcnow() + timedelta(seconds=ttl)}})
+
+async def release_ingest_job(job_id):
+    """Hands a claimed job back so any process can claim it again."""
+    await ingest_jobs.update_one({'_id': job_id}, {'$set': {'claimed_by': None, 'lease_until': None}})
+
+async def complete_ingest_job(job_id):
+    await ingest_jobs.delete_one({'_id': job_id})
+
 async def get_paginated_files(user_id, page: int, page_size: int = 5):
     skip = (page - 1) * page_size
     cursor = files.find({'owner_id': user_id}).sort('_id', -1).skip(skip).limit(page_size)
     return await cursor.to_list(length=page_size)
 
-async def search_user_files(user_id, query: str, page: int, page_size: int = 5):
-    search_filter = {'owner_id': user_id, 'file_name': {'$regex': query, '$options': 'i'}}
-    skip = (page - 1) * page_size
-    total_files = await files.count_documents(search_filter)
-    cursor = files.find(search_filter).sort('_id', -1).skip(skip).limit(page_size)
-    files_list = await cursor.to_list(length=page_size)
-    return files_list, total_files
+async def search_user_file_ids(user_id, query: str, limit: int = 1000):
+    """Returns the _ids of a user's matching files, newest first, for a search session."""
+    search_filter = {'owner_id': user_id, '$or': [{'file_name': {'$regex': query, '$options': 'i'}}, {'clean_title': {'$regex': query, '$options': 'i'}}]}
+    cursor = files.find(search_filter, {'_id': 1}).sort('_id', -1).limit(limit)
+    return [doc['_id'] for doc in await cursor.to_list(length=limit)]
+
+async def get_files_by_ids(ids):
+    """Fetches file records by _id, in the order given."""
+    docs = {doc['_id']: doc for doc in await files.find({'_id': {'$in': ids}}).to_list(length=len(ids))}
+    return [docs[_id] for _id in ids if _id in docs]
 
 async def total_users_count():
     return await users.count_documents({})
 
+async def rebuild_stats():
+    """
+    Recomputes the materialized stats with full scans. The final $set replaces the counters, so this
+    runs from Bot.start before the handlers and workers that increment them are live.
+    """
+    total_users = await users.count_documents({})
+    storage_owners = await get_storage_owners_count()
+    await owner_stats.delete_many({})
+    totals = {'files': 0, 'bytes': 0}
+    pipeline = [{'$group': {'_id': '$owner_id', 'files': {'$sum': 1}, 'bytes': {'$sum': {'$ifNull': ['$file_size', 0]}}}}]
+    async for row in files.aggregate(pipeline, allowDiskUse=True):
+        await owner_stats.update_one({'_id': row['_id']}, {'$set': {'files': row['files'], 'bytes': row['bytes']}}, upsert=True)
+        totals['files'] += row['files']; totals['bytes'] += row['bytes']
+    await bot_settings.update_one({'_id': STATS_ID}, {'$set': {
+        'total_users': total_users, 'storage_owners': storage_owners,
+        'total_files': totals['files'], 'total_bytes': totals['bytes'], 'built_at': _utcnow()
+    }}, upsert=True)
+
+async def ensure_stats():
+    # An increment can create the document before any rebuild, so only `built_at` proves one ran.
+    stats = await bot_settings.find_one({'_id': STATS_ID}, {'built_at': 1})
+    if not stats or not stats.get('built_at'):
+        logger.info("Stats were never built, rebuilding them once from the collections.")
+        await rebuild_stats()
+
+async def get_stats(top_owners=5):
+    """Reads the materialized stats: no collection scans."""
+    stats = await bot_settings.find_one({'_id': STATS_ID}) or {}
+    stats['top_owners'] = await owner_stats.find({}).sort('files', -1).limit(top_owners).to_list(length=top_owners)
+    hour_ago = time.time() - 3600
+    stats['ingested_last_hour'] = sum(1 for t in _recent_ingests if t > hour_ago)
+    return stats
+
 async def add_footer_button(user_id, button_name, button_url):
     button = {'name': button_name, 'url': button_url}
     await users.update_one({'user_id': user_id}, {'$push': {'footer_buttons': button}})
@@ -121,6 +487,45 @@ async def add_footer_button(user_id, button_name, button_url):
 async def remove_footer_button(user_id, button_name):
     await users.update_one({'user_id': user_id}, {'$pull': {'footer_buttons': {'name': button_name}}})
 
-async def delete_all_files():
-    result = await files.delete_many({})
+async def _reset_file_state():
+    global _known_files
+    await owner_stats.delete_many({})
+    await bot_settings.update_one({'_id': STATS_ID}, {'$set': {'total_files': 0, 'total_bytes': 0}}, upsert=True)
+    if _known_files is not None: _known_files = BloomFilter(1_000_000)
+    _delivery_cache.clear()
+
+async def reset_files_collection():
+    """Drops the files collection and recreates its indexes. Unlike delete_many({}), this is instant on any size."""
+    count = await files.estimated_document_count()
+    indexes = await files.index_information()
+    await files.drop()
+    for name, info in indexes.items():
+        if name == '_id_': continue
+        keys = info.pop('key')
+        for meta in ('v', 'ns'): info.pop(meta, None)
+        await files.create_index(keys, name=name, **info)
+    await _reset_file_state()
+    return count
+
+async def get_file_batch(query, limit, after_id=None, projection=None):
+    if after_id is not None: query = {**query, '_id': {'$gt': after_id}}
+    return await files.find(query, projection).sort('_id', 1).limit(limit).to_list(length=limit)
+
+async def delete_files_by_ids(ids):
+    """Deletes file records by _id and takes them out of the stats and the delivery cache."""
+    docs = await files.find({'_id': {'$in': ids}}, {'owner_id': 1, 'file_unique_id': 1, 'file_size': 1}).to_list(length=None)
+    result = await files.delete_many({'_id': {'$in': ids}})
+    per_owner = {}
+    for doc in docs:
+        _delivery_cache.pop(doc.get('file_unique_id'))
+        count, size = per_owner.get(doc.get('owner_id'), (0, 0))
+        per_owner[doc.get('owner_id')] = (count + 1, size + (doc.get('file_size') or 0))
+    if per_owner:
+        await owner_stats.bulk_write([
+            UpdateOne({'_id': owner_id}, {'$inc': {'files': -count, 'bytes': -size}})
+            for owner_id, (count, size) in per_owner.items()
+        ], ordered=False)
+        await bot_settings.update_one({'_id': STATS_ID}, {'$inc': {
+            'total_files': -sum(c for c, _ in per_owner.values()), 'total_bytes': -sum(b for _, b in per_owner.values())
+        }}, upsert=True)
     return result.deleted_count
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from database.db import (
+    get_backup_files, get_user_file_count, get_backup_job,
+    start_backup_job, save_backup_checkpoint, finish_backup_job, get_running_backup_jobs, set_backup_failed,
+    is_title_backfill_done
+)
+from config import Config
+from features import cluster
+from utils.helpers import (
+    BatchEntry, GET_MESSAGES_LIMIT, go_back_button, create_post, send_post, calculate_title_similarity, parse_raw_link, fetch_messages
+)
+
+logger = logging.getLogger(__name__)
+ACTIVE_BACKUP_TASKS = set()
+
+BACKUP_POST_INTERVAL = 3
+BACKUP_PAGE_SIZE = 500
+TITLE_FIELDS = ('clean_title', 'year', 'sort_key', 'label')
+
+def _cancel_markup(user_id):
+    return InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]])
+
+async def _edit_status(status_message, text, reply_markup=None):
+    try: await status_message.edit_text(text, reply_markup=reply_markup)
+    except Exception: pass
+
+async def _stream_groups(user_id, after):
+    """
+    Yields groups of similar files as (files, last_doc), where files are ((chat_id, message_id), title_fields).
+    Files are read by stored clean_title a page at a time, so similar titles arrive next to each other
+    and only the current group is kept in memory.
+    """
+    group, group_title, last_doc = [], None, None
+    while True:
+        docs = await get_backup_files(user_id, after, BACKUP_PAGE_SIZE)
+        for doc in docs:
+            after = {'clean_title': doc['clean_title'], '_id': doc['_id']}
+            link = parse_raw_link(doc.get('raw_link'))
+            if not link: continue
+            title = doc['clean_title']
+            if group and calculate_title_similarity(title, group_title) <= 0.90:
+                yield group, last_doc
+                group = []
+            if not group: group_title = title
+            group.append((link, {name: doc.get(name) for name in TITLE_FIELDS if name in doc}))
+            last_doc = after
+        if len(docs) < BACKUP_PAGE_SIZE: break
+    if group: yield group, last_doc
+
+async def _wait_for_title_backfill(user_id, status_message):
+    """
+    Backups page by the stored clean_title, so records the startup backfill hasn't reached yet would be
+    skipped. Waits for it to finish; returns False if the backup is cancelled meanwhile.
+    """
+    if await is_title_backfill_done(): return True
+    await _edit_status(status_message, "⏳ **Smart Backup:** Indexing file titles first, the backup starts right after...", _cancel_markup(user_id))
+    while not await is_title_backfill_done():
+        await asyncio.sleep(5)
+        if user_id not in ACTIVE_BACKUP_TASKS or (await get_backup_job(user_id) or {}).get('cancelled'): return False
+    return True
+
+async def _post_groups(client, user_id, channel_id, groups, job):
+    fetched = await fetch_messages(client, [link for files, _ in groups for link, _ in files])
+    for files, last_doc in groups:
+        if user_id not in ACTIVE_BACKUP_TASKS: return False
+        entries = [BatchEntry.from_message(fetched[link], fields) for link, fields in files if link in fetched]
+        entries = [entry for entry in entries if entry]
+        try:
+            if entries:
+                for post in await create_post(client, user_id, entries):
+                    await client.send_outbound(channel_id, lambda sender, send: send_post(sender, channel_id, post, send=send), BACKUP_POST_INTERVAL)
+        except Exception as e:
+            logger.exception(f"Failed to post batch during backup for user {user_id}.")
+            await client.send_message(user_id, f"Failed to back up a batch. Error: {e}")
+        job['groups_done'] += 1
+        job['files_done'] += len(files)
+        saved = await save_backup_checkpoint(user_id, last_doc, job['groups_done'], job['files_done'])
+        if saved and saved.get('cancelled'): ACTIVE_BACKUP_TASKS.discard(user_id)
+    return True
+
+async def run_backup_job(client, user_id, channel_id, status_message):
+    """Runs (or resumes) a user's Smart Backup, checkpointing after every posted group."""
+    if user_id in ACTIVE_BACKUP_TASKS: return False
+    lease = f"backup:{user_id}"
+    if Config.CLUSTER_MODE and not await cluster.acquire(lease):
+        await _edit_status(status_message, "A backup process is already running.", go_back_button(user_id))
+        return False
+    ACTIVE_BACKUP_TASKS.add(user_id)
+    try:
+        job = await get_backup_job(user_id)
+        if not job or job.get('channel_id') != channel_id or job.get('cancelled'):
+            job = await start_backup_job(user_id, channel_id)
+        elif job.get('failed'):
+            await set_backup_failed(user_id, False)
+        if not await _wait_for_title_backfill(user_id, status_message):
+            await finish_backup_job(user_id)
+            await _edit_status(status_message, "❌ Backup cancelled by user.", go_back_button(user_id))
+            return False
+        total_files = await get_user_file_count(user_id)
+        if not total_files:
+            await finish_backup_job(user_id)
+            return await _edit_status(status_message, "You have no files to back up.", go_back_button(user_id))
+
+        pending, pending_ids = [], 0
+        async for group in _stream_groups(user_id, job.get('after')):
+            pending.append(group); pending_ids += len(group[0])
+            if pending_ids < GET_MESSAGES_LIMIT: continue
+            if not await _post_groups(client, user_id, channel_id, pending, job): break
+            pending, pending_ids = [], 0
+            await _edit_status(status_message, f"🔄 **Smart Backup:** {job['files_done']} / {total_files} files, {job['groups_done']} posts done.", _cancel_markup(user_id))
+        else:
+            if not pending or await _post_groups(client, user_id, channel_id, pending, job):
+                await finish_backup_job(user_id)
+                await _edit_status(status_message, "✅ **Backup Complete!**", go_back_button(user_id))
+                return True
+
+        await finish_backup_job(user_id)
+        await _edit_status(status_message, "❌ Backup cancelled by user.", go_back_button(user_id))
+    except Exception as e:
+        # The checkpoint is kept, so starting the backup again continues from here. The job is
+        # flagged so the cluster leader doesn't auto-resume (and fail) it again on every heartbeat.
+        logger.exception("Major error in backup process")
+        try: await set_backup_failed(user_id)
+        except Exception as flag_error: logger.error(f"Could not flag backup of user {user_id} as failed: {flag_error}")
+        await _edit_status(status_message, f"A major error occurred: {e}\n\nStart the backup again to resume.", go_back_button(user_id))
+    finally:
+        ACTIVE_BACKUP_TASKS.discard(user_id)
+        if Config.CLUSTER_MODE: await cluster.release(lease)
+    return False
+
+async def resume_backup_jobs(client):
+    """Continues backups that were interrupted by a restart."""
+    for job in await get_running_backup_jobs():
+        user_id = job['_id']
+        if user_id in ACTIVE_BACKUP_TASKS: continue
+        # In clustered mode a live lease means another instance is still running it.
+        lease = f"backup:{user_id}"
+        if Config.CLUSTER_MODE and not await cluster.acquire(lease): continue
+        try:
+            status_message = await client.send_message(user_id, f"🔄 **Resuming Smart Backup** from {job.get('files_done', 0)} files...", reply_markup=_cancel_markup(user_id))
+            asyncio.create_task(run_backup_job(client, user_id, job['channel_id'], status_message))
+        except Exception as e:
+            logger.error(f"Could not resume backup for user {user_id}: {e}")
+            await set_backup_failed(user_id)
+            if Config.CLUSTER_MODE: await cluster.release(lease)
@@ -0,0 +1,47 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CHAT_REFRESH_AFTER = 600  # seconds before a cached entry is refreshed in the background
+
+# chat_id -> {'title', 'type', 'accessible', 'fetched_at'}
+_chats = {}
+_refreshing = set()
+
+async def _fetch_chat(client, chat_id):
+    """
+    Only successful lookups are cached. A failure may be a FloodWait or a network error, so it is
+    never remembered: the chat is tried again on the next render, and an older good entry is kept.
+    """
+    try:
+        chat = await client.get_chat(chat_id)
+    except Exception as e:
+        logger.warning(f"Chat {chat_id} is not accessible: {e}")
+        return _chats.get(chat_id) or {'title': None, 'type': None, 'accessible': False, 'fetched_at': time.monotonic()}
+    info = {'title': chat.title, 'type': chat.type.value if chat.type else None, 'accessible': True, 'fetched_at': time.monotonic()}
+    _chats[chat_id] = info
+    return info
+
+async def _refresh_in_background(client, chat_ids):
+    try: await asyncio.gather(*(_fetch_chat(client, chat_id) for chat_id in chat_ids))
+    finally: _refreshing.difference_update(chat_ids)
+
+async def get_chats_info(client, chat_ids):
+    """
+    Returns {chat_id: info} for the given chats. Unknown chats are fetched concurrently;
+    known ones are returned from cache at once and refreshed in the background when stale.
+    """
+    now = time.monotonic()
+    missing = [chat_id for chat_id in chat_ids if chat_id not in _chats]
+    fetched = dict(zip(missing, await asyncio.gather(*(_fetch_chat(client, chat_id) for chat_id in missing)))) if missing else {}
+    stale = [chat_id for chat_id in chat_ids if chat_id not in missing and chat_id not in _refreshing
+             and now - _chats[chat_id]['fetched_at'] > CHAT_REFRESH_AFTER]
+    if stale:
+        _refreshing.update(stale)
+        asyncio.create_task(_refresh_in_background(client, stale))
+    return {chat_id: fetched.get(chat_id) or _chats[chat_id] for chat_id in chat_ids}
+
+def invalidate_chat(chat_id):
+    _chats.pop(chat_id, None)
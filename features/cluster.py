@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import socket
+from config import Config
+from database.db import (
+    acquire_lease, release_lease, get_claimable_ingest_owners,
+    claim_ingest_job, renew_ingest_jobs, release_ingest_job, complete_ingest_job
+)
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_ID = Config.INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}"
+LEADER_LEASE = "leader"
+
+held_leases = set()
+# owner_id -> ingest jobs this process has claimed but not finished yet
+claimed_jobs = {}
+# Owners the claim worker is busy with, so the heartbeat doesn't hand their lease back mid-claim.
+claiming_owners = set()
+
+async def acquire(name):
+    """Takes or renews a cluster-wide lease for this process."""
+    if await acquire_lease(name, INSTANCE_ID, Config.LEASE_TTL):
+        held_leases.add(name)
+        return True
+    held_leases.discard(name)
+    return False
+
+async def release(name):
+    held_leases.discard(name)
+    await release_lease(name, INSTANCE_ID)
+
+async def release_all():
+    for name in list(held_leases): await release(name)
+
+def is_leader():
+    return LEADER_LEASE in held_leases
+
+async def try_global_notification_lock(duration=60):
+    """The cluster-wide 'coming soon' lock: only one process may engage it per `duration` seconds."""
+    return await acquire_lease("notification", INSTANCE_ID, duration, reentrant=False)
+
+async def finish_ingest_job(owner_id, job_id):
+    claimed_jobs[owner_id] = max(0, claimed_jobs.get(owner_id, 0) - 1)
+    await complete_ingest_job(job_id)
+
+async def heartbeat_worker(client):
+    """Renews our leases, hands idle owners back to the pool and lets the leader adopt orphaned backups."""
+    from features.backup import resume_backup_jobs
+    logger.info(f"Cluster heartbeat started for instance {INSTANCE_ID}.")
+    while True:
+        try:
+            for name in list(held_leases):
+                if name.startswith("owner:"):
+                    owner_id = int(name.split(":", 1)[1])
+                    if owner_id not in claiming_owners and not claimed_jobs.get(owner_id) and not client.open_batches.get(owner_id):
+                        await release(name); continue
+                if not await acquire(name): logger.warning(f"Lost lease '{name}' to another instance.")
+            if await acquire(LEADER_LEASE): await resume_backup_jobs(client)
+            await renew_ingest_jobs(INSTANCE_ID, Config.LEASE_TTL)
+        except Exception as e: logger.exception(f"Error in cluster heartbeat: {e}")
+        await asyncio.sleep(Config.LEASE_TTL / 3)
+
+async def ingest_claim_worker(client):
+    """
+    Feeds the local file_queue from the shared ingest_jobs collection. Each owner is leased to one
+    process at a time, so all of an owner's files, and therefore its open batches, stay in one place.
+    """
+    logger.info("Cluster ingest claimer started.")
+    while True:
+        claimed = 0
+        try:
+            for owner_id in await get_claimable_ingest_owners():
+                if client.file_queue.qsize() >= Config.INGEST_PREFETCH: break
+                lease = f"owner:{owner_id}"
+                claiming_owners.add(owner_id)
+                try:
+                    if not await acquire(lease): continue
+                    # Stop as soon as the lease is lost, so an owner's files never split across processes.
+                    while lease in held_leases and client.file_queue.qsize() < Config.INGEST_PREFETCH:
+                        job = await claim_ingest_job(owner_id, INSTANCE_ID, Config.LEASE_TTL)
+                        if not job: break
+                        claimed_jobs[owner_id] = claimed_jobs.get(owner_id, 0) + 1
+                        try: message = await client.send_with_protection(client.get_messages, job['chat_id'], job['message_id'])
+                        except Exception:
+                            claimed_jobs[owner_id] -= 1
+                            await release_ingest_job(job['_id']); raise
+                        if not message or message.empty:
+                            await finish_ingest_job(owner_id, job['_id']); continue
+                        await client.file_queue.put((message, owner_id, job['_id']))
+                        claimed += 1
+                finally:
+                    claiming_owners.discard(owner_id)
+        except Exception as e: logger.exception(f"Error in ingest claim worker: {e}")
+        if not claimed: await asyncio.sleep(1)
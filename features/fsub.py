@@ -0,0 +1,31 @@
+import logging
+from pyrogram.errors import UserNotParticipant
+from config import Config
+from utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Only positive membership results are cached, so a user who just joined is re-checked on retry.
+_members = TTLCache(ttl=Config.FSUB_MEMBER_CACHE_TTL, maxsize=50000)
+_invite_links = TTLCache(ttl=Config.FSUB_INVITE_LINK_TTL, maxsize=1000)
+
+async def is_fsub_member(client, channel_id, user_id):
+    """Returns True if the user has joined the force-subscribe channel."""
+    if _members.get((channel_id, user_id)): return True
+    try:
+        await client.get_chat_member(chat_id=channel_id, user_id=user_id)
+    except UserNotParticipant:
+        return False
+    _members.set((channel_id, user_id), True)
+    return True
+
+async def get_fsub_invite_link(client, channel_id):
+    """One invite link per channel, re-exported only after it expires from the cache."""
+    link = _invite_links.get(channel_id)
+    if link: return link
+    try: link = await client.export_chat_invite_link(channel_id)
+    except Exception as e:
+        logger.error(f"Could not export invite link for FSub channel {channel_id}: {e}")
+        return None
+    _invite_links.set(channel_id, link)
+    return link
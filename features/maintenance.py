@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from database.db import reset_files_collection, get_file_batch, delete_files_by_ids, get_user_file_count
+from utils.helpers import parse_raw_link, fetch_messages
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 1000
+
+# Name of the maintenance job currently running, if any. Only one runs at a time.
+active_job = None
+
+class Progress:
+    """Edits a status message with job progress, at most once every `interval` seconds."""
+    def __init__(self, status_message, title, interval=3):
+        self.status_message = status_message
+        self.title = title
+        self.interval = interval
+        self.last_edit = 0
+
+    async def update(self, text, force=False):
+        if not force and time.monotonic() - self.last_edit < self.interval: return
+        self.last_edit = time.monotonic()
+        try: await self.status_message.edit_text(f"{self.title}\n\n{text}")
+        except Exception: pass
+
+async def reset_all_files(progress):
+    deleted = await reset_files_collection()
+    await progress.update(f"✅ **Success!**\n\nDeleted **{deleted}** file entries from the database.", force=True)
+
+async def purge_owner(progress, owner_id):
+    total = await get_user_file_count(owner_id)
+    deleted = 0
+    while True:
+        batch = await get_file_batch({'owner_id': owner_id}, DELETE_BATCH_SIZE, projection={'_id': 1})
+        if not batch: break
+        deleted += await delete_files_by_ids([doc['_id'] for doc in batch])
+        await progress.update(f"🗑️ Deleted {deleted} / {total} files of `{owner_id}`...")
+        await asyncio.sleep(0)
+    await progress.update(f"✅ **Done!** Deleted **{deleted}** files of `{owner_id}`.", force=True)
+
+async def _find_orphans(client, docs):
+    """Returns the _ids of records whose raw_link message no longer exists."""
+    records = [(parse_raw_link(doc.get('raw_link')), doc['_id']) for doc in docs]
+    records = [(link, doc_id) for link, doc_id in records if link]
+    alive = await fetch_messages(client, {link for link, _ in records})
+    return [doc_id for link, doc_id in records if link not in alive]
+
+async def clean_orphans(progress, client):
+    checked, deleted, after_id = 0, 0, None
+    while True:
+        batch = await get_file_batch({}, DELETE_BATCH_SIZE, after_id=after_id, projection={'raw_link': 1})
+        if not batch: break
+        after_id = batch[-1]['_id']
+        orphans = await _find_orphans(client, batch)
+        if orphans: deleted += await delete_files_by_ids(orphans)
+        checked += len(batch)
+        await progress.update(f"🔍 Checked {checked} records, removed {deleted} orphans...")
+    await progress.update(f"✅ **Done!** Checked **{checked}** records and removed **{deleted}** orphans.", force=True)
+
+def start_maintenance_job(name, status_message, title, job, *args):
+    """Runs a maintenance job in the background. Returns False if another one is already running."""
+    global active_job
+    if active_job: return False
+    active_job = name
+    progress = Progress(status_message, title)
+
+    async def runner():
+        global active_job
+        try: await job(progress, *args)
+        except Exception as e:
+            logger.exception(f"Maintenance job '{name}' failed")
+            await progress.update(f"❌ Failed: {e}", force=True)
+        finally: active_job = None
+
+    asyncio.create_task(runner())
+    return True
@@ -1,12 +1,68 @@
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
+import html
 import logging
 import re
 from config import Config
+from database.db import get_poster_file_id, save_poster_file_id, delete_poster_file_id
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+# poster_id -> Telegram photo file_id, mirrored from the poster_cache collection.
+_poster_file_ids = {}
+# (base_name, year) -> running or finished lookup task, so a lookup started early is reused.
+_lookups = TTLCache(ttl=600, maxsize=500)
+
+# Targeted extraction for the two IMDb pages we read. The regexes stop at the first match
+# instead of building a whole DOM; BeautifulSoup is only a fallback if IMDb changes its markup.
+_RESULT_LINK_RE = re.compile(r'<a\b[^>]*\bipc-metadata-list-summary-item__t\b[^>]*>', re.I)
+_POSTER_MARKER = 'data-testid="hero-media__poster"'
+_IMG_RE = re.compile(r'<img\b[^>]*>', re.I)
+_DIV_RE = re.compile(r'<(/?)div\b', re.I)
+_IPC_IMAGE_RE = re.compile(r'(?<![\w-])class="[^"]*(?<![\w-])ipc-image(?![\w-])')
+# The lookbehind keeps data-href/data-src (lazy-loading placeholders) from matching.
+_HREF_RE = re.compile(r'(?<![\w-])href="([^"]+)"')
+_SRC_RE = re.compile(r'(?<![\w-])src="([^"]+)"')
+
+def _element_at(page: str, marker: str):
+    """The markup of the <div> carrying `marker`, up to its matching </div>, or None."""
+    found = page.find(marker)
+    start = page.rfind('<div', 0, found) if found != -1 else -1
+    if start == -1: return None
+    depth = 0
+    for tag in _DIV_RE.finditer(page, start):
+        depth += -1 if tag.group(1) else 1
+        if not depth: return page[start:tag.end()]
+    return None
+
+def _soup_select_attr(page: str, selector: str, attr: str):
+    from bs4 import BeautifulSoup  # heavy, and only needed when the fast path misses
+    try:
+        import lxml  # noqa: F401
+        parser = 'lxml'
+    except ImportError:
+        parser = 'html.parser'
+    tag = BeautifulSoup(page, parser).select_one(selector)
+    return tag.get(attr) if tag else None
+
+def extract_first_result_href(page: str):
+    """Returns the href of the first IMDb search result."""
+    tag = _RESULT_LINK_RE.search(page)
+    href = _HREF_RE.search(tag.group(0)) if tag else None
+    if href: return html.unescape(href.group(1))
+    return _soup_select_attr(page, "a.ipc-metadata-list-summary-item__t", 'href')
+
+def extract_poster_src(page: str):
+    """Returns the src of the hero poster image on an IMDb title page."""
+    poster = _element_at(page, _POSTER_MARKER)
+    if poster is not None:
+        tag = next((m.group(0) for m in _IMG_RE.finditer(poster) if _IPC_IMAGE_RE.search(m.group(0))), None)
+        src = _SRC_RE.search(tag) if tag else None
+        if src: return html.unescape(src.group(1))
+        return None
+    return _soup_select_attr(page, 'div[data-testid="hero-media__poster"] img.ipc-image', 'src')
+
 async def _find_poster_from_imdb(query: str):
     """Finds a poster and its unique IMDb ID (e.g., tt12345)."""
     try:
@@ -15,21 +71,20 @@ async def _find_poster_from_imdb(query: str):
         async with aiohttp.ClientSession(headers=headers) as s:
             async with s.get(search_url, timeout=10) as resp:
                 if resp.status != 200: return None, None
-                soup = BeautifulSoup(await resp.text(), 'html.parser')
-                result = soup.select_one("a.ipc-metadata-list-summary-item__t")
-                if not result or not result.get('href'): return None, None
+                # Extraction runs in a worker thread so it never blocks the event loop.
+                href = await asyncio.to_thread(extract_first_result_href, await resp.text())
+                if not href: return None, None
                 
-                imdb_id_match = re.search(r'/title/(tt\d+)/', result['href'])
+                imdb_id_match = re.search(r'/title/(tt\d+)/', href)
                 if not imdb_id_match: return None, None
                 imdb_id = imdb_id_match.group(1)
                 
                 movie_url = f"https://www.imdb.com/title/{imdb_id}/"
                 async with s.get(movie_url, timeout=10) as movie_resp:
                     if movie_resp.status != 200: return None, None
-                    movie_soup = BeautifulSoup(await movie_resp.text(), 'html.parser')
-                    img = movie_soup.select_one('div[data-testid="hero-media__poster"] img.ipc-image')
-                    if img and img.get('src'):
-                        poster_url = img['src'].split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
+                    src = await asyncio.to_thread(extract_poster_src, await movie_resp.text())
+                    if src:
+                        poster_url = src.split('_V1_')[0] + "_V1_FMjpg_UX1000_.jpg"
                         return poster_url, f"imdb-{imdb_id}"
     except Exception: pass
     return None, None
@@ -82,3 +137,40 @@ async def get_poster(base_name: str, year: str = None):
     """Public function that returns only the POSTER URL for posting."""
     poster_url, _ = await _get_poster_and_id(base_name, year)
     return poster_url
+
+def prefetch_poster(base_name: str, year: str = None):
+    """Starts the poster lookup in the background; get_poster_with_id will await this same task."""
+    key = (base_name, year)
+    task = _lookups.get(key)
+    if not task:
+        task = asyncio.create_task(_get_poster_and_id(base_name, year))
+        _lookups.set(key, task)
+        task.add_done_callback(lambda done: _forget_failed_lookup(key, done))
+    return task
+
+def _forget_failed_lookup(key, task):
+    # Only found posters are kept, so a transient IMDb/TMDB failure is retried by the next post.
+    if task.cancelled() or task.exception() or not task.result()[0]:
+        if _lookups.get(key) is task: _lookups.pop(key)
+
+async def get_poster_with_id(base_name: str, year: str = None):
+    """Public function that returns both the POSTER URL and its UNIQUE ID."""
+    return await prefetch_poster(base_name, year)
+
+async def get_cached_poster(poster_id: str):
+    """Returns the Telegram file_id of a poster we have already uploaded, if any."""
+    if not poster_id: return None
+    if poster_id not in _poster_file_ids:
+        file_id = await get_poster_file_id(poster_id)
+        if not file_id: return None
+        _poster_file_ids[poster_id] = file_id
+    return _poster_file_ids[poster_id]
+
+async def remember_poster(poster_id: str, file_id: str):
+    if not poster_id or not file_id or _poster_file_ids.get(poster_id) == file_id: return
+    _poster_file_ids[poster_id] = file_id
+    await save_poster_file_id(poster_id, file_id)
+
+async def forget_poster(poster_id: str):
+    _poster_file_ids.pop(poster_id, None)
+    await delete_poster_file_id(poster_id)
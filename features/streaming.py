@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+import re
+from urllib.parse import quote
+from aiohttp import web
+from config import Config
+from database.db import get_file_by_unique_id
+from utils.cache import TTLCache
+from utils.helpers import verify_download_link
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024  # Pyrogram's stream_media chunk size
+RANGE_RE = re.compile(r'bytes=(\d*)-(\d*)$')
+
+_stream_slots = asyncio.Semaphore(Config.DL_MAX_STREAMS)
+_messages = TTLCache(ttl=600, maxsize=1000)
+# Requests per file in the last hour; chunks are only cached for files asked for more than once.
+_hits = TTLCache(ttl=3600, maxsize=10000)
+
+class ChunkCache:
+    """A small on-disk LRU of 1 MiB file chunks, bounded by total size."""
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, file_unique_id, index):
+        return os.path.join(self.directory, f"{file_unique_id}.{index}")
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f: data = f.read()
+            os.utime(path)  # mark as recently used
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f: f.write(data)
+        os.replace(tmp_path, path)
+        entries = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith('.tmp')]
+        total = sum(e.stat().st_size for e in entries)
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            if total <= self.max_bytes: break
+            total -= entry.stat().st_size
+            try: os.remove(entry.path)
+            except FileNotFoundError: pass
+
+    async def read(self, file_unique_id, index):
+        return await asyncio.to_thread(self._read, self._path(file_unique_id, index))
+
+    async def write(self, file_unique_id, index, data):
+        try: await asyncio.to_thread(self._write, self._path(file_unique_id, index), data)
+        except OSError as e: logger.warning(f"Could not cache chunk {index} of {file_unique_id}: {e}")
+
+chunk_cache = ChunkCache(Config.DL_CACHE_DIR, Config.DL_CACHE_MB * 1024 * 1024)
+
+async def _get_stored_message(client, file_unique_id):
+    message = _messages.get(file_unique_id)
+    if message: return message
+    file_data = await get_file_by_unique_id(file_unique_id)
+    if not file_data or not client.owner_db_channel_id: return None
+    message = await client.get_messages(client.owner_db_channel_id, file_data['file_id'])
+    if not message or message.empty or not message.media: return None
+    _messages.set(file_unique_id, message)
+    return message
+
+async def _iter_chunks(client, message, file_unique_id, first, last, use_cache):
+    """Yields chunks first..last, from the disk cache where possible and from Telegram otherwise."""
+    stream, next_index = None, None
+    try:
+        for index in range(first, last + 1):
+            data = await chunk_cache.read(file_unique_id, index) if use_cache else None
+            if data is None:
+                if stream is None or next_index != index:
+                    if stream: await stream.aclose()
+                    stream = client.stream_media(message, offset=index)
+                data = await stream.__anext__()
+                next_index = index + 1
+                if use_cache: await chunk_cache.write(file_unique_id, index, data)
+            yield data
+    finally:
+        if stream: await stream.aclose()
+
+def _parse_range(header, size):
+    """Returns (start, end) inclusive, or None if the range can't be satisfied."""
+    if not header: return 0, size - 1
+    match = RANGE_RE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)): return None
+    if not match.group(1):
+        start, end = max(0, size - int(match.group(2))), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    return (start, end) if start <= end and start < size else None
+
+def _content_disposition(file_name):
+    """An attachment header safe for any file name: an ASCII fallback plus the RFC 5987 UTF-8 form."""
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', '_', file_name)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name, safe='')}"
+
+async def handle_download(request):
+    client = request.app['bot']
+    file_unique_id = request.match_info.get('file_unique_id')
+    # Links are signed by send_file, so the owner's fsub and shortener gates can't be skipped.
+    if not verify_download_link(file_unique_id, request.query.get('exp'), request.query.get('sig')):
+        return web.Response(text="This download link is invalid or has expired.", status=403)
+    message = await _get_stored_message(client, file_unique_id)
+    if not message: return web.Response(text="File not found.", status=404)
+    media = getattr(message, message.media.value)
+    size = media.file_size
+
+    byte_range = _parse_range(request.headers.get('Range'), size)
+    if not byte_range:
+        return web.Response(status=416, headers={'Content-Range': f"bytes */{size}"})
+    start, end = byte_range
+    partial = 'Range' in request.headers
+    headers = {
+        'Content-Type': getattr(media, 'mime_type', None) or 'application/octet-stream',
+        'Content-Length': str(end - start + 1),
+        'Accept-Ranges': 'bytes',
+        'Content-Disposition': _content_disposition(getattr(media, 'file_name', None) or file_unique_id)
+    }
+    if partial: headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+    # Download managers probe with HEAD first: answer from the headers alone, without a stream slot.
+    if request.method == 'HEAD': return web.Response(status=206 if partial else 200, headers=headers)
+    if _stream_slots.locked():
+        return web.Response(text="Too many downloads in progress, try again shortly.", status=503, headers={'Retry-After': '10'})
+
+    hits = _hits.get(file_unique_id, 0) + 1
+    _hits.set(file_unique_id, hits)
+    async with _stream_slots:
+        response = web.StreamResponse(status=206 if partial else 200, headers=headers)
+        await response.prepare(request)
+
+        first, last = start // CHUNK_SIZE, end // CHUNK_SIZE
+        position = first * CHUNK_SIZE
+        try:
+            async for chunk in _iter_chunks(client, message, file_unique_id, first, last, use_cache=hits > 1):
+                piece = chunk[max(0, start - position):end - position + 1]
+                position += len(chunk)
+                await response.write(piece)
+        except (ConnectionResetError, asyncio.CancelledError):
+            logger.info(f"Download of {file_unique_id} aborted by client.")
+            raise
+        await response.write_eof()
+        return response
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import time
+from pyrogram import Client
+from pyrogram.errors import FloodWait, ChatAdminRequired, ChatWriteForbidden, ChannelPrivate, PeerIdInvalid, UserNotParticipant, Unauthorized
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean this helper can't reach one chat; the helper itself is fine elsewhere.
+ACCESS_ERRORS = (ChatAdminRequired, ChatWriteForbidden, ChannelPrivate, PeerIdInvalid, UserNotParticipant)
+# A dropped connection or a revoked helper token. Only these, FloodWait and ACCESS_ERRORS prove the
+# send didn't happen; anything else may have been delivered (a timeout after Telegram accepted it)
+# or would fail the same way on any bot (a BadRequest), so it is raised without blaming the helper.
+HELPER_ERRORS = (ConnectionError, Unauthorized)
+
+async def _direct(method, *args, **kwargs):
+    # Helpers let FloodWait through so the pool can move the send to another bot.
+    return await method(*args, **kwargs)
+
+class Worker:
+    """One helper bot client and what the pool knows about it."""
+    def __init__(self, client):
+        self.client = client
+        self.flood_until = 0
+        self.down_until = 0
+        self.failures = 0
+        self.sent = 0
+        self.chat_slots = {}
+        self.no_access = set()
+
+    def ready_at(self, chat_id):
+        return max(self.flood_until, self.chat_slots.get(chat_id, 0))
+
+    def healthy(self, now):
+        return self.down_until <= now
+
+class WorkerPool:
+    """
+    Spreads outbound sends to channels over optional helper bots (HELPER_BOT_TOKENS), each of which
+    has its own Telegram rate limits. A send goes to the helper that can post in that chat soonest;
+    a FloodWait moves it to another helper, and anything a helper can't do falls back to the main bot.
+    """
+    def __init__(self):
+        self.main = None
+        self.workers = []
+
+    def __bool__(self):
+        return bool(self.workers)
+
+    async def _start_helper(self, index, token):
+        # Sessions are named by bot ID: Pyrogram reuses an existing session file without logging in,
+        # so a name tied to the token's position would silently keep the old bot after a reorder.
+        client = Client(f"FinalStorageBot_helper_{token.split(':')[0]}", api_id=Config.API_ID, api_hash=Config.API_HASH, bot_token=token, no_updates=True)
+        try:
+            await client.start()
+            client.is_pool_helper = True
+            logger.info(f"Helper bot @{client.me.username} started.")
+            return Worker(client)
+        except Exception as e:
+            logger.error(f"Could not start helper bot #{index}: {e}")
+
+    async def start(self, main, tokens):
+        self.main = main
+        if not tokens: return
+        started = await asyncio.gather(*(self._start_helper(i, token) for i, token in enumerate(tokens, 1)))
+        self.workers = [worker for worker in started if worker]
+        logger.info(f"Worker pool running with {len(self.workers)} of {len(tokens)} helper bots.")
+
+    async def stop(self):
+        for worker in self.workers:
+            try: await worker.client.stop()
+            except Exception as e: logger.error(f"Could not stop helper bot: {e}")
+        self.workers = []
+
+    def _pick(self, chat_id, exclude):
+        now = time.monotonic()
+        candidates = [w for w in self.workers if w not in exclude and w.healthy(now) and chat_id not in w.no_access]
+        return min(candidates, key=lambda w: (w.ready_at(chat_id), w.sent), default=None)
+
+    def _mark_failed(self, worker, error):
+        worker.failures += 1
+        if worker.failures >= Config.HELPER_MAX_FAILURES:
+            worker.down_until = time.monotonic() + Config.HELPER_COOLDOWN
+            worker.failures = 0
+            logger.warning(f"Helper bot @{worker.client.me.username} sidelined for {Config.HELPER_COOLDOWN}s after repeated errors: {error}")
+
+    async def run(self, chat_id, call, interval=Config.POST_INTERVAL):
+        """
+        Runs call(client, send) for a send into chat_id, pacing each bot to one send per `interval`
+        seconds in that chat. `send` wraps the API call the way that client needs.
+        """
+        tried = set()
+        while True:
+            worker = self._pick(chat_id, tried)
+            if not worker: break
+            slot = max(time.monotonic(), worker.ready_at(chat_id))
+            worker.chat_slots[chat_id] = slot + interval
+            if slot > time.monotonic(): await asyncio.sleep(slot - time.monotonic())
+            try:
+                result = await call(worker.client, _direct)
+                worker.failures = 0; worker.sent += 1
+                return result
+            except FloodWait as e:
+                worker.flood_until = time.monotonic() + e.value
+                logger.warning(f"Helper bot @{worker.client.me.username} hit a FloodWait of {e.value}s, rerouting.")
+                # Only give up on this helper if another one can take the send.
+                if any(w.flood_until <= time.monotonic() for w in self.workers if w is not worker): tried.add(worker)
+            except ACCESS_ERRORS as e:
+                worker.no_access.add(chat_id)
+                logger.warning(f"Helper bot @{worker.client.me.username} can't post in {chat_id}, make it an admin there: {e}")
+                tried.add(worker)
+            except HELPER_ERRORS as e:
+                self._mark_failed(worker, e)
+                logger.error(f"Helper bot @{worker.client.me.username} could not reach Telegram for a send to {chat_id}: {e}")
+                tried.add(worker)
+        await self.main.wait_for_chat_slot(chat_id, interval)
+        return await call(self.main, self.main.send_with_protection)
+
+    def status(self):
+        now = time.monotonic()
+        lines = []
+        for worker in self.workers:
+            state = ("🔴 down" if not worker.healthy(now)
+                     else f"🟡 flood {worker.flood_until - now:.0f}s" if worker.flood_until > now else "🟢 ok")
+            blocked = f", no access to {len(worker.no_access)} chats" if worker.no_access else ""
+            lines.append(f"• @{worker.client.me.username}: {state}, {worker.sent} sent{blocked}")
+        return "\n".join(lines)
+
+pool = WorkerPool()
@@ -4,11 +4,15 @@ from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from database.db import (
-    total_users_count, get_all_user_ids, get_storage_owners_count, 
-    get_storage_owner_ids, get_normal_user_ids, delete_all_files, set_owner_db_channel
+    get_stats, get_all_user_ids, get_storage_owner_ids, get_normal_user_ids, set_owner_db_channel
 )
+from features import maintenance
 from features.broadcaster import broadcast_message
-from utils.helpers import go_back_button
+from features.maintenance import start_maintenance_job, reset_all_files, purge_owner, clean_orphans
+from features.worker_pool import pool
+from utils.helpers import go_back_button, format_bytes
+from utils.metrics import delivery_latency
+from utils.watchdog import watchdog
 
 logger = logging.getLogger(__name__)
 
@@ -41,19 +45,39 @@ async def set_owner_db_handler(client, query):
 @Client.on_message(filters.command("stats") & filters.user(Config.ADMIN_ID))
 async def stats_handler(_, message):
     try:
-        total = await total_users_count()
-        storage_owners = await get_storage_owners_count()
+        stats = await get_stats()
+        top_owners = "\n".join(
+            f"• `{owner['_id']}`: {owner.get('files', 0)} files ({format_bytes(owner.get('bytes', 0))})" for owner in stats['top_owners']
+        ) or "_None yet_"
         text = (
             "📊 **Bot Statistics**\n\n"
-            f"**Total Users:** `{total}`\n"
-            f"**Storage Owners:** `{storage_owners}`\n"
-            f"_(Storage Owners are users who have set at least one channel)_"
+            f"**Total Users:** `{stats.get('total_users', 0)}`\n"
+            f"**Storage Owners:** `{stats.get('storage_owners', 0)}`\n"
+            f"_(Storage Owners are users who have set at least one channel)_\n\n"
+            f"**Files Stored:** `{stats.get('total_files', 0)}` ({format_bytes(stats.get('total_bytes', 0))})\n"
+            f"**Ingested (last hour):** `{stats['ingested_last_hour']}`\n\n"
+            f"**Top Owners by Files:**\n{top_owners}\n\n"
+            f"**File Delivery Latency:** `{delivery_latency.summary()}`"
         )
         await message.reply_text(text)
     except Exception:
         logger.exception("Error in /stats handler")
         await message.reply_text("An error occurred while fetching stats.")
 
+@Client.on_message(filters.command("queue") & filters.user(Config.ADMIN_ID))
+async def queue_handler(client, message):
+    depths = client.file_queue.depths()
+    lines = [f"• `{owner_id}`: {depth} files" for owner_id, depth in depths[:15]]
+    text = f"📥 **Ingest Queue:** `{client.file_queue.qsize()}` files from `{len(depths)}` owners\n\n" + ("\n".join(lines) or "_Queue is empty._")
+    if pool: text += f"\n\n🤖 **Helper Bots:**\n{pool.status()}"
+    await message.reply_text(text)
+
+@Client.on_message(filters.command("loopstats") & filters.user(Config.ADMIN_ID))
+async def loop_stats_handler(_, message):
+    if not Config.LOOP_WATCHDOG:
+        return await message.reply_text("The event loop watchdog is off. Set `LOOP_WATCHDOG=true` to enable it.")
+    await message.reply_text(f"⏱️ **Event Loop Health**\n\n{watchdog.report()}")
+
 @Client.on_message(filters.command("broadcast") & filters.user(Config.ADMIN_ID))
 async def broadcast_prompt_handler(client, message):
     if not message.reply_to_message:
@@ -104,6 +128,21 @@ async def reset_db_prompt(client, query):
 
 @Client.on_callback_query(filters.regex("reset_db_confirm") & filters.user(Config.ADMIN_ID))
 async def reset_db_confirm(client, query):
-    await query.message.edit_text("⚙️ Resetting files database... Please wait.")
-    deleted_count = await delete_all_files()
-    await query.message.edit_text(f"✅ **Success!**\n\nDeleted **{deleted_count}** file entries from the database.")
+    status = await query.message.edit_text("⚙️ Resetting files database... Please wait.")
+    if not start_maintenance_job("reset", status, "⚠️ **Reset Files DB**", reset_all_files):
+        await query.message.edit_text(f"Another maintenance job (`{maintenance.active_job}`) is still running.")
+
+@Client.on_message(filters.command("purge_owner") & filters.user(Config.ADMIN_ID))
+async def purge_owner_handler(client, message):
+    if len(message.command) < 2 or not message.command[1].lstrip("-").isdigit():
+        return await message.reply_text("Usage: `/purge_owner <user_id>`")
+    owner_id = int(message.command[1])
+    status = await message.reply_text(f"🗑️ Purging files of `{owner_id}`...")
+    if not start_maintenance_job("purge", status, "🗑️ **Purge Owner Files**", purge_owner, owner_id):
+        await status.edit_text(f"Another maintenance job (`{maintenance.active_job}`) is still running.")
+
+@Client.on_message(filters.command("clean_orphans") & filters.user(Config.ADMIN_ID))
+async def clean_orphans_handler(client, message):
+    status = await message.reply_text("🔍 Looking for records whose stored message is gone...")
+    if not start_maintenance_job("orphans", status, "🧹 **Orphan Cleanup**", clean_orphans, client):
+        await status.edit_text(f"Another maintenance job (`{maintenance.active_job}`) is still running.")
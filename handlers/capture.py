@@ -0,0 +1,17 @@
+import logging
+from pyrogram import Client, filters
+from utils.capture import recorder
+
+logger = logging.getLogger(__name__)
+
+# Runs before every other group and never stops propagation, so capture can't change behaviour.
+if recorder:
+    @Client.on_message(filters.channel & (filters.document | filters.video | filters.audio), group=-1)
+    async def capture_file_handler(client, message):
+        try: recorder.record_file(message)
+        except Exception: logger.exception("Error capturing channel file update")
+
+    @Client.on_message(filters.command("start") & filters.private & filters.regex(r"^/start (final)?get_"), group=-1)
+    async def capture_start_handler(client, message):
+        try: recorder.record_start(message)
+        except Exception: logger.exception("Error capturing /start update")
@@ -1,6 +1,7 @@
 import logging
 from pyrogram import Client, filters
-from database.db import find_owner_by_db_channel
+from config import Config
+from database.db import find_owner_by_db_channel, enqueue_ingest_job
 
 logger = logging.getLogger(__name__)
 
@@ -23,8 +24,9 @@ async def new_file_handler(client, message):
             logger.warning("Owner Database Channel not set by admin. Ignoring file.")
             return
         
-        await client.file_queue.put((message, user_id))
-        logger.info(f"Added file '{media.file_name}' to the queue for user {user_id}.")
+        if Config.CLUSTER_MODE: await enqueue_ingest_job(user_id, message.chat.id, message.id)
+        else: await client.file_queue.put((message, user_id, None))
+        logger.info(f"Added file '{media.file_name}' to the queue for user {user_id}.", extra={'sample': True})
 
     except Exception:
         logger.exception("Error in new_file_handler while adding to queue")
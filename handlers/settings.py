@@ -1,19 +1,20 @@
 import asyncio
-import base64
 import logging
+import secrets
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import MessageNotModified
 from database.db import (
     get_user, update_user, add_to_list, remove_from_list,
     get_user_file_count, add_footer_button, remove_footer_button,
-    get_all_user_files, get_paginated_files, search_user_files
+    get_paginated_files, search_user_file_ids, get_files_by_ids, request_backup_cancel
 )
-# This import is now corrected to use the proper function names from helpers.py
-from utils.helpers import go_back_button, get_main_menu, create_post, get_clean_title_and_year, calculate_title_similarity
+from features.backup import ACTIVE_BACKUP_TASKS, run_backup_job
+from features.chat_cache import get_chats_info, invalidate_chat
+from utils.cache import TTLCache
+from utils.helpers import go_back_button, get_main_menu
 
 logger = logging.getLogger(__name__)
-ACTIVE_BACKUP_TASKS = set()
 
 async def safe_edit_message(query, *args, **kwargs):
     """A helper function to safely edit messages and handle common errors."""
@@ -80,19 +81,39 @@ async def my_files_handler(client, query):
     except Exception:
         logger.exception("Error in my_files_handler"); await query.answer("Something went wrong.", show_alert=True)
 
-async def _format_and_send_search_results(client, query, user_id, search_query, page):
+SEARCH_RESULT_LIMIT = 1000
+# session_id -> {'user_id', 'query', 'ids'}; (user_id, query) -> session_id
+SEARCH_SESSIONS = TTLCache(ttl=900, maxsize=1000)
+SEARCH_SESSION_KEYS = TTLCache(ttl=900, maxsize=1000)
+
+async def _get_search_session(user_id, search_query):
+    """Runs the search once and keeps the ordered result IDs, so paging is just a slice."""
+    session_id = SEARCH_SESSION_KEYS.get((user_id, search_query))
+    if session_id and SEARCH_SESSIONS.get(session_id): return session_id
+    ids = await search_user_file_ids(user_id, search_query, SEARCH_RESULT_LIMIT)
+    session_id = secrets.token_urlsafe(6)
+    SEARCH_SESSIONS.set(session_id, {'user_id': user_id, 'query': search_query, 'ids': ids})
+    SEARCH_SESSION_KEYS.set((user_id, search_query), session_id)
+    return session_id
+
+async def _format_and_send_search_results(client, query, user_id, session_id, page):
     files_per_page = 5
-    files_list, total_files = await search_user_files(user_id, search_query, page, files_per_page)
-    text = f"**🔎 Search Results for `{search_query}` ({total_files} Found)**\n\n"
+    session = SEARCH_SESSIONS.get(session_id)
+    if not session or session['user_id'] != user_id:
+        return await safe_edit_message(query, text="⌛ This search has expired. Please search again.", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔍 Search My Files", callback_data="search_my_files")]]))
+    search_query, ids = session['query'], session['ids']
+    total_files = len(ids)
+    files_list = await get_files_by_ids(ids[(page - 1) * files_per_page:page * files_per_page])
+    total_label = f"{total_files}+" if total_files >= SEARCH_RESULT_LIMIT else str(total_files)
+    text = f"**🔎 Search Results for `{search_query}` ({total_label} Found)**\n\n"
     if not files_list: text += "No files found for your query."
     else:
         for file in files_list:
             deep_link = f"https://t.me/{client.me.username}?start=get_{file['file_unique_id']}"
             text += f"**File:** `{file['file_name']}`\n**Link:** [Click Here to Get File]({deep_link})\n\n"
     buttons, nav_row = [], []
-    encoded_query = base64.urlsafe_b64encode(search_query.encode()).decode().strip("=")
-    if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_results_{page-1}_{encoded_query}"))
-    if total_files > page * files_per_page: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_results_{page+1}_{encoded_query}"))
+    if page > 1: nav_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=f"search_results_{page-1}_{session_id}"))
+    if total_files > page * files_per_page: nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"search_results_{page+1}_{session_id}"))
     if nav_row: buttons.append(nav_row)
     buttons.append([InlineKeyboardButton("📚 Back to Full List", callback_data="my_files_1")])
     buttons.append([InlineKeyboardButton("« Go Back to Settings", callback_data=f"go_back_{user_id}")])
@@ -105,7 +126,8 @@ async def search_my_files_prompt(client, query):
         prompt = await query.message.edit_text("**🔍 Search Your Files**\n\nPlease send the name of the file you want to find.", reply_markup=go_back_button(user_id))
         response = await client.listen(chat_id=user_id, timeout=300, filters=filters.text)
         await response.delete()
-        await _format_and_send_search_results(client, query, user_id, response.text, 1)
+        session_id = await _get_search_session(user_id, response.text)
+        await _format_and_send_search_results(client, query, user_id, session_id, 1)
     except asyncio.TimeoutError: await safe_edit_message(query, text="❗️ **Timeout:** Search cancelled.", reply_markup=go_back_button(user_id))
     except Exception as e:
         logger.exception("Error in search_my_files_prompt"); await safe_edit_message(query, text=f"An error occurred: {e}", reply_markup=go_back_button(user_id))
@@ -114,10 +136,8 @@ async def search_my_files_prompt(client, query):
 async def search_results_paginator(client, query):
     try:
         page = int(query.matches[0].group(1))
-        encoded_query = query.matches[0].group(2)
-        padding = 4 - (len(encoded_query) % 4)
-        search_query = base64.urlsafe_b64decode(encoded_query + "=" * padding).decode()
-        await _format_and_send_search_results(client, query, query.from_user.id, search_query, page)
+        session_id = query.matches[0].group(2)
+        await _format_and_send_search_results(client, query, query.from_user.id, session_id, page)
     except Exception:
         logger.exception("Error during search pagination"); await safe_edit_message(query, text="An error occurred during pagination.")
 
@@ -126,10 +146,8 @@ async def backup_links_handler(client, query):
     user = await get_user(query.from_user.id)
     post_channels = user.get('post_channels', [])
     if not post_channels: return await query.answer("You have not set any Post Channels yet.", show_alert=True)
-    kb = []
-    for ch_id in post_channels:
-        try: kb.append([InlineKeyboardButton((await client.get_chat(ch_id)).title, callback_data=f"start_backup_{ch_id}")])
-        except: continue
+    chats = await get_chats_info(client, post_channels)
+    kb = [[InlineKeyboardButton(chats[ch_id]['title'], callback_data=f"start_backup_{ch_id}")] for ch_id in post_channels if chats[ch_id]['accessible']]
     if not kb: return await query.answer("Could not access any of your Post Channels.", show_alert=True)
     kb.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{query.from_user.id}")])
     await safe_edit_message(query, text="**🔄 Smart Backup**\n\nSelect a channel to back up your posts to.", reply_markup=InlineKeyboardMarkup(kb))
@@ -139,68 +157,15 @@ async def start_backup_process(client, query):
     user_id = query.from_user.id
     if user_id in ACTIVE_BACKUP_TASKS: return await query.answer("A backup process is already running.", show_alert=True)
     channel_id = int(query.data.split("_")[-1])
-    ACTIVE_BACKUP_TASKS.add(user_id)
-    try:
-        await query.message.edit_text("⏳ `Step 1/3:` Fetching all your file records...")
-        all_file_docs = await (await get_all_user_files(user_id)).to_list(length=None)
-        if not all_file_docs:
-            return await safe_edit_message(query, text="You have no files to back up.", reply_markup=go_back_button(user_id))
-
-        await query.message.edit_text("⏳ `Step 2/3:` Intelligently grouping files by similarity...")
-        
-        batches = []
-        for doc in all_file_docs:
-            if not doc.get('file_name'): continue
-            
-            doc_clean_title, _ = get_clean_title_and_year(doc['file_name'])
-            if not doc_clean_title: continue
-
-            added = False
-            for batch in batches:
-                batch_clean_title, _ = get_clean_title_and_year(batch[0]['file_name'])
-                if calculate_title_similarity(doc_clean_title, batch_clean_title) > 0.90:
-                    batch.append(doc)
-                    added = True
-                    break
-            if not added:
-                batches.append([doc])
-
-        total_batches = len(batches)
-        await safe_edit_message(query, text=f"✅ `Step 2/3:` Found **{total_batches}** unique posts to create. Starting backup...", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-        
-        for i, file_docs_batch in enumerate(batches):
-            if user_id not in ACTIVE_BACKUP_TASKS:
-                await safe_edit_message(query, text="❌ Backup cancelled by user.", reply_markup=go_back_button(user_id)); return
-            try:
-                message_ids = [int(d['raw_link'].split('/')[-1]) for d in file_docs_batch]
-                source_chat_id = int("-100" + file_docs_batch[0]['raw_link'].split('/')[-2])
-                file_messages = await client.get_messages(source_chat_id, message_ids)
-                posts_to_send = await create_post(client, user_id, file_messages)
-                
-                for post in posts_to_send:
-                    poster, caption, footer = post
-                    if poster: await client.send_photo(channel_id, photo=poster, caption=caption, reply_markup=footer)
-                    else: await client.send_message(channel_id, caption, reply_markup=footer, disable_web_page_preview=True)
-                    await asyncio.sleep(3)
-                
-                progress_text = f"🔄 `Step 3/3:` Progress: {i + 1} / {total_batches} batches processed."
-                await safe_edit_message(query, text=progress_text, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
-            except Exception as e:
-                logger.exception(f"Failed to post batch during backup for user {user_id}.")
-                await client.send_message(user_id, f"Failed to back up a batch. Error: {e}")
-        
-        await query.message.delete()
-        await client.send_message(user_id, "✅ **Backup Complete!**", reply_markup=go_back_button(user_id))
-    except Exception as e:
-        logger.exception("Major error in backup process"); await safe_edit_message(query, text=f"A major error occurred: {e}", reply_markup=go_back_button(user_id))
-    finally:
-        ACTIVE_BACKUP_TASKS.discard(user_id)
+    await safe_edit_message(query, text="⏳ **Smart Backup:** Reading your file records...", reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("❌ Cancel Backup", callback_data=f"cancel_backup_{user_id}")]]))
+    asyncio.create_task(run_backup_job(client, user_id, channel_id, query.message))
 
 @Client.on_callback_query(filters.regex(r"cancel_backup_"))
 async def cancel_backup_handler(client, query):
     user_id = int(query.data.split("_")[-1])
     if query.from_user.id != user_id: return await query.answer("This is not for you.", show_alert=True)
-    if user_id in ACTIVE_BACKUP_TASKS:
+    # The backup may be running in another process in clustered mode, so flag the job in Mongo as well.
+    if await request_backup_cancel(user_id) or user_id in ACTIVE_BACKUP_TASKS:
         ACTIVE_BACKUP_TASKS.discard(user_id); await query.answer("Cancellation signal sent.", show_alert=True)
     else: await query.answer("No active backup process found.", show_alert=True)
 
@@ -246,9 +211,10 @@ async def manage_channels_handler(client, query):
     buttons = []
     if channels:
         text += "Here are your connected channels. Click to remove."
+        chats = await get_chats_info(client, channels)
         for ch_id in channels:
-            try: chat = await client.get_chat(ch_id); buttons.append([InlineKeyboardButton(f"❌ {chat.title}", callback_data=f"rm_{ch_type}_{ch_id}")])
-            except: buttons.append([InlineKeyboardButton(f"❌ Unavailable ({ch_id})", callback_data=f"rm_{ch_type}_{ch_id}")])
+            label = chats[ch_id]['title'] if chats[ch_id]['accessible'] else f"Unavailable ({ch_id})"
+            buttons.append([InlineKeyboardButton(f"❌ {label}", callback_data=f"rm_{ch_type}_{ch_id}")])
     else: text += "You haven't added any channels yet."
     buttons.append([InlineKeyboardButton("➕ Add New Channel", callback_data=f"add_{ch_type}_ch")])
     buttons.append([InlineKeyboardButton("« Go Back", callback_data=f"go_back_{user_id}")])
@@ -258,6 +224,7 @@ async def manage_channels_handler(client, query):
 async def remove_channel_handler(client, query):
     _, ch_type, ch_id_str = query.data.split("_")
     await remove_from_list(query.from_user.id, f"{ch_type}_channels", int(ch_id_str))
+    invalidate_chat(int(ch_id_str))
     await query.answer("Channel removed!", show_alert=True)
     query.data = f"manage_{ch_type}_ch"
     await manage_channels_handler(client, query)
@@ -275,6 +242,7 @@ async def add_channel_prompt(client, query):
         response = await client.listen(chat_id=user_id, filters=filters.forwarded, timeout=300)
         if response.forward_from_chat:
             await add_to_list(user_id, ch_type_key, response.forward_from_chat.id)
+            invalidate_chat(response.forward_from_chat.id)
             await response.reply_text(f"✅ Connected to **{response.forward_from_chat.title}**.", reply_markup=go_back_button(user_id))
         else: await response.reply_text("Not a valid forwarded message.", reply_markup=go_back_button(user_id))
         if 'question' in locals() and question: await question.delete()
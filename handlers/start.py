@@ -1,29 +1,32 @@
 import traceback
+import asyncio
 import logging
+import time
 from pyrogram import Client, filters, enums
-from pyrogram.errors import UserNotParticipant, MessageNotModified
+from pyrogram.errors import MessageNotModified
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from config import Config
-from database.db import add_user, get_file_by_unique_id, get_user, get_owner_db_channel
-from utils.helpers import get_main_menu, decode_link
+from database.db import add_user, get_file_with_owner, get_owner_db_channel
+from utils.helpers import get_main_menu, decode_link, get_download_link
 from features.shortener import get_shortlink
+from features.fsub import is_fsub_member, get_fsub_invite_link
+from utils.metrics import delivery_latency
 
 logger = logging.getLogger(__name__)
 
-async def send_file(client, user_id, file_unique_id):
+async def send_file(client, user_id, file_unique_id, started=None):
     """Helper function to send the final file."""
     try:
-        file_data = await get_file_by_unique_id(file_unique_id)
+        file_data, owner_settings = await get_file_with_owner(file_unique_id)
         if not file_data:
             return await client.send_message(user_id, "Sorry, this file is no longer available.")
         
-        owner_db_id = await get_owner_db_channel()
+        owner_db_id = client.owner_db_channel_id or await get_owner_db_channel()
         if not owner_db_id:
             logger.error("Owner DB Channel not set, cannot send file.")
             return await client.send_message(user_id, "A configuration error occurred.")
 
         # --- NEW: Create hyperlinked caption here ---
-        owner_settings = await get_user(file_data['owner_id'])
         filename_url = owner_settings.get("filename_url")
         file_name = file_data.get('file_name', 'N/A')
         
@@ -32,12 +35,16 @@ async def send_file(client, user_id, file_unique_id):
         else:
             caption = f"✅ **Here is your file!**\n\n`{file_name}`"
 
+        # The direct link is only issued here, after the fsub and shortener steps.
+        download_button = InlineKeyboardMarkup([[InlineKeyboardButton("⬇️ Direct Download", url=get_download_link(file_unique_id))]]) if Config.DL_ENABLED else None
         await client.copy_message(
             chat_id=user_id,
             from_chat_id=owner_db_id,
             message_id=file_data['file_id'],
-            caption=caption
+            caption=caption,
+            reply_markup=download_button
         )
+        if started: delivery_latency.record(time.monotonic() - started)
     except Exception:
         logger.exception("Error in send_file function")
         await client.send_message(user_id, "Something went wrong while sending the file.")
@@ -45,15 +52,18 @@ async def send_file(client, user_id, file_unique_id):
 @Client.on_message(filters.command("start") & filters.private)
 async def start_command(client, message):
     if message.from_user.is_bot: return
+    started = time.monotonic()
     user_id = message.from_user.id
-    await add_user(user_id)
+    payload = message.command[1] if len(message.command) > 1 else None
+    # Registering the user must not delay the file on the delivery hot path.
+    if payload and payload.startswith("finalget_"): asyncio.create_task(add_user(user_id))
+    else: await add_user(user_id)
     
-    if len(message.command) > 1:
-        payload = message.command[1]
+    if payload:
         try:
             if payload.startswith("finalget_"):
                 _, file_unique_id = payload.split("_", 1)
-                await send_file(client, user_id, file_unique_id)
+                await send_file(client, user_id, file_unique_id, started)
             elif payload.startswith("get_"):
                 await handle_file_request(client, message, user_id, payload)
         except Exception:
@@ -72,17 +82,13 @@ async def start_command(client, message):
 
 async def handle_file_request(client, message, user_id, payload):
     file_unique_id = payload.split("_", 1)[1]
-    file_data = await get_file_by_unique_id(file_unique_id)
+    file_data, owner_settings = await get_file_with_owner(file_unique_id)
     if not file_data: return await message.reply_text("File not found or link has expired.")
     owner_id = file_data['owner_id']
-    owner_settings = await get_user(owner_id)
     fsub_channel = owner_settings.get('fsub_channel')
     if fsub_channel:
-        try:
-            await client.get_chat_member(chat_id=fsub_channel, user_id=user_id)
-        except UserNotParticipant:
-            try: invite_link = await client.export_chat_invite_link(fsub_channel)
-            except: invite_link = None
+        if not await is_fsub_member(client, fsub_channel, user_id):
+            invite_link = await get_fsub_invite_link(client, fsub_channel)
             buttons = [[InlineKeyboardButton("📢 Join Channel", url=invite_link)], [InlineKeyboardButton("🔄 Retry", callback_data=f"retry_{payload}")]]
             return await message.reply_text("You must join the channel to continue.", reply_markup=InlineKeyboardMarkup(buttons))
     
@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import gzip
+import json
+import time
+from types import SimpleNamespace
+
+import bot as bot_module
+from bot import Bot
+from database.db import add_user, add_to_list
+from handlers.new_post import new_file_handler
+from handlers.start import start_command
+from utils.metrics import LatencyTracker
+
+# Replays a capture recorded with CAPTURE_FILE through the real handlers in handlers/ and the
+# ingest worker, against a stand-in Telegram client. Point MONGO_URI/DATABASE_NAME at a local,
+# disposable database first: handlers read and write it exactly as in production.
+#   python replay.py capture.jsonl.gz --speed 10 --api-latency 0.05
+
+class StandInBot(Bot):
+    """The real Bot, minus the network: every Telegram call just waits `api_latency` seconds."""
+    def __init__(self, api_latency):
+        super().__init__()
+        self.api_latency = api_latency
+        self.me = SimpleNamespace(id=0, username="replay_bot")
+        self.owner_db_channel_id = -1000000000001
+        self._next_id = 0
+
+    async def _api_call(self, chat_id=None):
+        await asyncio.sleep(self.api_latency)
+        self._next_id += 1
+        return SimpleNamespace(id=self._next_id, chat=SimpleNamespace(id=chat_id), delete=self._noop)
+
+    async def _noop(self, *args, **kwargs):
+        await asyncio.sleep(self.api_latency)
+
+    async def send_message(self, chat_id, *args, **kwargs): return await self._api_call(chat_id)
+    async def copy_message(self, chat_id, *args, **kwargs): return await self._api_call(chat_id)
+    async def get_chat_member(self, *args, **kwargs): return await self._api_call()
+    async def export_chat_invite_link(self, chat_id): await self._noop(); return "https://t.me/+replay"
+
+def _file_message(client, record):
+    media = SimpleNamespace(file_name=record['file_name'], file_unique_id=record['file_unique_id'],
+                            file_size=record['file_size'], mime_type=record['mime_type'])
+
+    async def copy(chat_id, *args, **kwargs):
+        sent = await client._api_call(chat_id)
+        sent.media = SimpleNamespace(value=record['media'])
+        setattr(sent, record['media'], media)
+        return sent
+
+    message = SimpleNamespace(id=record['message_id'], chat=SimpleNamespace(id=record['chat_id']),
+                              media=SimpleNamespace(value=record['media']), copy=copy)
+    setattr(message, record['media'], media)
+    return message
+
+def _start_message(client, record):
+    async def reply_text(*args, **kwargs): return await client._api_call(record['user'])
+    user = SimpleNamespace(id=record['user'], is_bot=False, mention=f"user {record['user']}")
+    return SimpleNamespace(from_user=user, text=record['text'], command=record['text'].split(),
+                           chat=SimpleNamespace(id=record['user']), reply_text=reply_text)
+
+def load_capture(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+async def seed_owners(records):
+    """Creates one stand-in owner per captured DB channel, so new_file_handler finds an owner."""
+    for chat_id in {r['chat_id'] for r in records if r['kind'] == 'file'}:
+        await add_user(abs(chat_id))
+        await add_to_list(abs(chat_id), 'db_channels', chat_id)
+
+async def replay(path, speed, api_latency, seed):
+    records = load_capture(path)
+    if seed: await seed_owners(records)
+    client = StandInBot(api_latency)
+    bot_module.prefetch_poster = lambda *args, **kwargs: None  # no poster lookups against IMDb/TMDB
+    worker = asyncio.create_task(client.file_processor_worker())
+    latencies = {'file': LatencyTracker(size=len(records) or 1), 'start': LatencyTracker(size=len(records) or 1)}
+
+    async def dispatch(record):
+        started = time.monotonic()
+        if record['kind'] == 'file': await new_file_handler(client, _file_message(client, record))
+        else: await start_command(client, _start_message(client, record))
+        latencies[record['kind']].record(time.monotonic() - started)
+
+    began, tasks = time.monotonic(), []
+    for record in records:
+        if speed:
+            delay = began + record['t'] / speed - time.monotonic()
+            if delay > 0: await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(dispatch(record)))
+    await asyncio.gather(*tasks)
+    handled = time.monotonic() - began
+    # qsize() hits 0 as soon as the worker takes the last item; join() also waits for it to be processed.
+    await client.file_queue.join()
+    drained = time.monotonic() - began
+    worker.cancel()
+    await bot_module.flush_file_writes()
+
+    print(f"Replayed {len(records)} updates at {f'{speed:g}x' if speed else 'max speed'} in {handled:.2f}s (ingest queue drained at {drained:.2f}s)")
+    for kind, tracker in latencies.items():
+        print(f"  {kind:>5}: {tracker.summary()}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay captured update traffic against the handlers.")
+    parser.add_argument("capture")
+    parser.add_argument("--speed", default="1", help="time scale: 1, 10, ... or 'max'")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="seconds per stand-in Telegram call")
+    parser.add_argument("--seed", action="store_true", help="create stand-in owners for the captured DB channels")
+    args = parser.parse_args()
+    asyncio.run(replay(args.capture, 0 if args.speed == "max" else float(args.speed), args.api_latency, args.seed))
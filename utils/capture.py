@@ -0,0 +1,59 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class TrafficRecorder:
+    """
+    Records incoming updates with their timing to a gzip'd JSON-lines file for replay.py.
+    User IDs are replaced by keyed hashes; the key is random per process and never written,
+    so captures can't be mapped back to real accounts.
+    """
+    def __init__(self, path, flush_every=200, flush_after=2.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_after = flush_after
+        self.started = time.monotonic()
+        self._key = os.urandom(16)
+        self._buffer = []
+        self._timer = None
+
+    def anonymize(self, user_id):
+        digest = hashlib.blake2b(str(user_id).encode(), key=self._key, digest_size=6).digest()
+        return int.from_bytes(digest, 'big')
+
+    def record(self, kind, **fields):
+        self._buffer.append({'t': round(time.monotonic() - self.started, 4), 'kind': kind, **fields})
+        if len(self._buffer) >= self.flush_every:
+            asyncio.create_task(self.flush())
+        elif not self._timer:
+            self._timer = asyncio.get_running_loop().call_later(self.flush_after, lambda: asyncio.create_task(self.flush()))
+
+    def _append(self, lines):
+        with gzip.open(self.path, 'at', encoding='utf-8') as f: f.writelines(lines)
+
+    async def flush(self):
+        if self._timer: self._timer.cancel(); self._timer = None
+        if not self._buffer: return
+        records, self._buffer = self._buffer, []
+        lines = [json.dumps(r, separators=(',', ':'), ensure_ascii=False) + "\n" for r in records]
+        try: await asyncio.to_thread(self._append, lines)
+        except OSError as e: logger.error(f"Could not write {len(lines)} captured updates: {e}")
+
+    def record_file(self, message):
+        media = getattr(message, message.media.value, None)
+        if not media: return
+        self.record('file', chat_id=message.chat.id, message_id=message.id, media=message.media.value,
+                    file_name=getattr(media, 'file_name', None), file_unique_id=media.file_unique_id,
+                    file_size=getattr(media, 'file_size', None), mime_type=getattr(media, 'mime_type', None))
+
+    def record_start(self, message):
+        self.record('start', user=self.anonymize(message.from_user.id), text=message.text)
+
+recorder = TrafficRecorder(Config.CAPTURE_FILE) if Config.CAPTURE_FILE else None
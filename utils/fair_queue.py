@@ -0,0 +1,74 @@
+import asyncio
+from collections import deque
+
+class FairQueue:
+    """
+    A drop-in for asyncio.Queue of (message, owner_id, job_id) items that serves owners fairly.
+    Each owner gets a sub-queue and owners are served by deficit round-robin, so one owner
+    importing thousands of files can't hold back everyone else's uploads. An owner's weight
+    is how many files they may take per round (default 1). Weights of 0 or less are ignored,
+    since an owner that never earns a turn would make get() spin forever.
+    """
+    def __init__(self, weights=None):
+        self.weights = {owner_id: weight for owner_id, weight in (weights or {}).items() if weight > 0}
+        self._queues = {}
+        self._deficits = {}
+        self._ring = deque()
+        self._not_empty = asyncio.Event()
+        self._size = 0
+        self._unfinished = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def put_nowait(self, item):
+        owner_id = item[1]
+        if owner_id not in self._queues:
+            self._queues[owner_id] = deque()
+            self._deficits[owner_id] = 0
+            self._ring.append(owner_id)
+        self._queues[owner_id].append(item)
+        self._size += 1
+        self._unfinished += 1
+        self._finished.clear()
+        self._not_empty.set()
+
+    async def put(self, item):
+        self.put_nowait(item)
+
+    async def get(self):
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        while True:
+            owner_id = self._ring[0]
+            if self._deficits[owner_id] < 1:
+                self._deficits[owner_id] += self.weights.get(owner_id, 1)
+            if self._deficits[owner_id] >= 1:
+                break
+            self._ring.rotate(-1)
+        queue = self._queues[owner_id]
+        item = queue.popleft()
+        self._deficits[owner_id] -= 1
+        self._size -= 1
+        if not queue:
+            del self._queues[owner_id], self._deficits[owner_id]
+            self._ring.popleft()
+        elif self._deficits[owner_id] < 1:
+            self._ring.rotate(-1)
+        return item
+
+    def task_done(self):
+        # Clamped at 0: a worker cancelled while waiting in get() still calls this from its finally.
+        self._unfinished = max(0, self._unfinished - 1)
+        if not self._unfinished: self._finished.set()
+
+    async def join(self):
+        """Waits until every item put so far has been taken and marked done, like asyncio.Queue.join()."""
+        await self._finished.wait()
+
+    def qsize(self):
+        return self._size
+
+    def depths(self):
+        """Queued files per owner, deepest first."""
+        return sorted(((owner_id, len(queue)) for owner_id, queue in self._queues.items()), key=lambda d: -d[1])
@@ -1,18 +1,23 @@
 import re
+import time
+import hmac
 import base64
+import hashlib
 import logging
+from pyrogram.errors import FloodWait
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import Config
 from database.db import get_user
-from features.poster import get_poster
-from thefuzz import fuzz
+from features.poster import get_poster_with_id, get_cached_poster, remember_poster, forget_poster
 
 logger = logging.getLogger(__name__)
 
 FILES_PER_POST = 20
+GET_MESSAGES_LIMIT = 200  # Telegram's get_messages limit per call
 
 def calculate_title_similarity(title1: str, title2: str) -> float:
     """Calculates the similarity between two titles using fuzzy matching."""
+    from thefuzz import fuzz  # imported on first use to keep startup fast
     return fuzz.token_sort_ratio(title1, title2) / 100.0
 
 def get_clean_title_and_year(name: str):
@@ -40,57 +45,124 @@ def get_clean_title_and_year(name: str):
     
     return (final_title, year) if final_title else ("Untitled", year)
 
+def get_file_label(file_name: str) -> str:
+    """The human-readable file label shown in posts."""
+    return re.sub(r'\.\w+$', '', file_name or '').replace('_', ' ').strip()
 
-async def create_post(client, user_id, messages):
+def get_sort_key(file_name: str) -> str:
+    """A string form of natural_sort_key that MongoDB can sort on (numbers are zero-padded)."""
+    return re.sub(r'\d+', lambda m: m.group(0).zfill(10), (file_name or '').lower())
+
+def get_file_title_fields(file_name: str) -> dict:
+    """The canonical title fields stored on every file record, computed once at ingest."""
+    clean_title, year = get_clean_title_and_year(file_name)
+    return {'clean_title': clean_title, 'year': year, 'sort_key': get_sort_key(file_name), 'label': get_file_label(file_name)}
+
+
+class BatchEntry:
+    """
+    The few fields create_post needs from a stored file message. Batches hold these instead of
+    whole Pyrogram Message objects, and they round-trip through dicts for persistence.
+    """
+    __slots__ = ('message_id', 'chat_id', 'media_type', 'file_name', 'file_unique_id', 'file_size',
+                 'clean_title', 'year', 'sort_key', 'label')
+
+    def __init__(self, message_id, chat_id, media_type, file_name, file_unique_id, file_size,
+                 clean_title=None, year=None, sort_key=None, label=None):
+        self.message_id = message_id
+        self.chat_id = chat_id
+        self.media_type = media_type
+        self.file_name = file_name
+        self.file_unique_id = file_unique_id
+        self.file_size = file_size
+        self.clean_title = clean_title
+        self.year = year
+        self.sort_key = sort_key
+        self.label = label
+
+    @classmethod
+    def from_message(cls, message, title_fields=None):
+        """
+        Returns None for messages without a media object. `title_fields` are the stored fields from
+        get_file_title_fields; they are only recomputed for records saved before they existed.
+        """
+        media = getattr(message, message.media.value, None) if message.media else None
+        if not media: return None
+        file_name = getattr(media, 'file_name', None) or ""
+        if not title_fields or 'sort_key' not in title_fields: title_fields = get_file_title_fields(file_name)
+        return cls(message.id, message.chat.id, message.media.value, file_name, media.file_unique_id, getattr(media, 'file_size', None),
+                   title_fields['clean_title'], title_fields['year'], title_fields['sort_key'], title_fields['label'])
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data.get(name) for name in cls.__slots__})
+
+
+async def create_post(client, user_id, entries):
+    """Renders the posts for a batch of BatchEntry records."""
     user = await get_user(user_id)
-    if not user: return []
-
-    # ================================================================= #
-    # === THIS ENTIRE FUNCTION HAS BEEN METICULOUSLY CORRECTED        ===
-    # === The bug was getting the media object from message.media     ===
-    # === instead of the message itself. This is now fixed everywhere.===
-    # ================================================================= #
-
-    # CORRECTLY get the media object from the message
-    first_media_obj = getattr(messages[0], messages[0].media.value, None)
-    if not first_media_obj:
-        logger.error("Could not get media object from the first message in batch.")
-        return []
-    
-    primary_title, year = get_clean_title_and_year(first_media_obj.file_name)
+    if not user or not entries: return []
+
+    primary_title, year = entries[0].clean_title, entries[0].year
     
-    messages.sort(key=lambda m: natural_sort_key(getattr(m, m.media.value, None).file_name if getattr(m, m.media.value, None) else ""))
+    entries = sorted(entries, key=lambda e: e.sort_key)
     
     base_caption_header = f"🎬 **{primary_title} {f'({year})' if year else ''}**"
-    post_poster = await get_poster(primary_title, year) if user.get('show_poster', True) else None
+    post_poster, poster_id = await get_poster_with_id(primary_title, year) if user.get('show_poster', True) else (None, None)
     
     footer_buttons = user.get('footer_buttons', [])
     footer_keyboard = InlineKeyboardMarkup([[InlineKeyboardButton(btn['name'], url=btn['url'])] for btn in footer_buttons]) if footer_buttons else None
     
-    if len(messages) == 1:
-        media = getattr(messages[0], messages[0].media.value)
-        file_label = re.sub(r'\.\w+$', '', media.file_name).replace('_', ' ').strip()
-        link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{media.file_unique_id}"
-        caption_body = f"📁 `{file_label}` ({format_bytes(media.file_size)})\n\n[🔗 Click Here to Get File]({link})"
-        return [(post_poster, f"{base_caption_header}\n\n{caption_body}", footer_keyboard)]
+    if len(entries) == 1:
+        entry = entries[0]
+        file_label = entry.label
+        link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{entry.file_unique_id}"
+        caption_body = f"📁 `{file_label}` ({format_bytes(entry.file_size)})\n\n[🔗 Click Here to Get File]({link})"
+        return [(post_poster, f"{base_caption_header}\n\n{caption_body}", footer_keyboard, poster_id)]
     else:
-        posts, total = [], len(messages)
+        posts, total = [], len(entries)
         num_posts = (total + FILES_PER_POST - 1) // FILES_PER_POST
         for i in range(num_posts):
-            chunk = messages[i*FILES_PER_POST:(i+1)*FILES_PER_POST]
+            chunk = entries[i*FILES_PER_POST:(i+1)*FILES_PER_POST]
             header = f"{base_caption_header} (Part {i+1}/{num_posts})" if num_posts > 1 else base_caption_header
             links = []
-            for m in chunk:
-                # CORRECTLY get the media object from the message inside the loop
-                media = getattr(m, m.media.value)
-                label = re.sub(r'\.\w+$', '', media.file_name).replace('_', ' ').strip()
-                link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{media.file_unique_id}"
+            for entry in chunk:
+                label = entry.label
+                link = f"http://{Config.VPS_IP}:{Config.VPS_PORT}/get/{entry.file_unique_id}"
                 links.append(f"📁 `{label}` - [Click Here]({link})")
             
             final_caption = f"{header}\n\n" + "\n\n".join(links)
-            posts.append((post_poster, final_caption, footer_keyboard))
+            posts.append((post_poster, final_caption, footer_keyboard, poster_id))
         return posts
 
+async def send_post(client, chat_id, post, send=None):
+    """
+    Sends one post from create_post. The poster is sent by its cached Telegram file_id
+    when we have one, so Telegram doesn't re-fetch the image from IMDb/TMDB every time.
+    """
+    poster, caption, footer, poster_id = post
+    send = send or (lambda method, *args, **kwargs: method(*args, **kwargs))
+    if not poster:
+        return await send(client.send_message, chat_id, caption, reply_markup=footer, disable_web_page_preview=True)
+
+    # file_ids only work for the bot that received them, so helper bots keep their own.
+    if poster_id and getattr(client, 'is_pool_helper', False): poster_id = f"{poster_id}@{client.me.id}"
+    cached_file_id = await get_cached_poster(poster_id)
+    if cached_file_id:
+        try:
+            return await send(client.send_photo, chat_id, cached_file_id, caption=caption, reply_markup=footer)
+        except FloodWait: raise
+        except Exception as e:
+            logger.warning(f"Cached poster for '{poster_id}' was rejected, re-uploading from URL: {e}")
+            await forget_poster(poster_id)
+
+    sent = await send(client.send_photo, chat_id, poster, caption=caption, reply_markup=footer)
+    if sent and sent.photo: await remember_poster(poster_id, sent.photo.file_id)
+    return sent
+
 
 async def get_main_menu(user_id):
     user_settings = await get_user(user_id)
@@ -124,6 +196,42 @@ def format_bytes(size):
 async def get_file_raw_link(message):
     return f"https://t.me/c/{str(message.chat.id).replace('-100', '')}/{message.id}"
 
+def parse_raw_link(raw_link):
+    """(chat_id, message_id) from a stored raw_link, or None if it is malformed."""
+    try:
+        chat_part, message_id = raw_link.split('/')[-2:]
+        return int("-100" + chat_part), int(message_id)
+    except (ValueError, AttributeError):
+        return None
+
+async def fetch_messages(client, links):
+    """
+    Fetches the messages behind (chat_id, message_id) links with as few get_messages calls as possible.
+    Returns {(chat_id, message_id): message} for the ones that still exist.
+    """
+    ids_by_chat = {}
+    for chat_id, message_id in links: ids_by_chat.setdefault(chat_id, []).append(message_id)
+    fetched = {}
+    for chat_id, message_ids in ids_by_chat.items():
+        for i in range(0, len(message_ids), GET_MESSAGES_LIMIT):
+            chunk = message_ids[i:i + GET_MESSAGES_LIMIT]
+            for msg in await client.send_with_protection(client.get_messages, chat_id, chunk):
+                if msg and not msg.empty: fetched[(chat_id, msg.id)] = msg
+    return fetched
+
+def _download_signature(file_unique_id: str, expires: int) -> str:
+    key = (Config.DL_SECRET or hashlib.sha256(f"dl:{Config.BOT_TOKEN}".encode()).hexdigest()).encode()
+    return hmac.new(key, f"{file_unique_id}:{expires}".encode(), hashlib.sha256).hexdigest()[:32]
+
+def get_download_link(file_unique_id: str) -> str:
+    """A signed /dl link for one file, valid for DL_LINK_TTL seconds."""
+    expires = int(time.time()) + Config.DL_LINK_TTL
+    return f"http://{Config.VPS_IP}:{Config.VPS_PORT}/dl/{file_unique_id}?exp={expires}&sig={_download_signature(file_unique_id, expires)}"
+
+def verify_download_link(file_unique_id: str, expires: str, signature: str) -> bool:
+    if not expires or not expires.isdigit() or int(expires) < time.time(): return False
+    return hmac.compare_digest(_download_signature(file_unique_id, int(expires)), signature or "")
+
 def encode_link(text: str) -> str:
     return base64.urlsafe_b64encode(text.encode()).decode().strip("=")
 
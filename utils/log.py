@@ -0,0 +1,61 @@
+import atexit
+import json
+import logging
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import Config
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record), 'level': record.levelname,
+            'logger': record.name, 'message': record.getMessage()
+        }
+        if record.exc_info: entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SampleFilter(logging.Filter):
+    """
+    Rate-limits records logged with extra={'sample': True} (the per-file info messages)
+    to `per_second` per logger, and reports how many were dropped.
+    """
+    def __init__(self, per_second):
+        super().__init__()
+        self.per_second = per_second
+        self.windows = {}
+
+    def filter(self, record):
+        if not getattr(record, 'sample', False) or record.levelno > logging.INFO: return True
+        second = int(time.monotonic())
+        window_start, allowed, dropped = self.windows.get(record.name, (second, 0, 0))
+        if window_start != second:
+            if dropped:
+                record.msg = f"{record.msg} (+{dropped} similar messages suppressed)"
+            window_start, allowed, dropped = second, 0, 0
+        if allowed >= self.per_second:
+            self.windows[record.name] = (window_start, allowed, dropped + 1)
+            return False
+        self.windows[record.name] = (window_start, allowed + 1, dropped)
+        return True
+
+def setup_logging():
+    """
+    Handlers run on a background listener thread; the event loop only enqueues records.
+    Sampling is applied before enqueueing so dropped records cost nothing downstream.
+    """
+    formatter = JsonFormatter() if Config.LOG_JSON else logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    file_handler = RotatingFileHandler(Config.LOG_FILE, maxBytes=Config.LOG_MAX_BYTES, backupCount=Config.LOG_BACKUPS, encoding='utf-8')
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler): handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setFormatter(logging.Formatter("%(message)s"))  # the listener's handlers do the real formatting
+    queue_handler.addFilter(SampleFilter(Config.LOG_SAMPLE_PER_SEC))
+    listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logging.basicConfig(level=logging.INFO, handlers=[queue_handler], force=True)
+    return listener
@@ -0,0 +1,21 @@
+from collections import deque
+
+class LatencyTracker:
+    """Keeps the last `size` latency samples (in seconds) and reports percentiles."""
+    def __init__(self, size=1000):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, p):
+        if not self.samples: return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def summary(self):
+        if not self.samples: return "no samples yet"
+        return f"p50 {self.percentile(50) * 1000:.0f} ms, p99 {self.percentile(99) * 1000:.0f} ms ({len(self.samples)} samples)"
+
+# Time from receiving `/start finalget_…` to the file being copied to the user.
+delivery_latency = LatencyTracker()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from config import Config
+from utils.metrics import LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LoopWatchdog:
+    """
+    Measures event-loop lag from inside the loop and watches for stalls from a separate thread.
+    When the loop is blocked for longer than `threshold` seconds, the thread captures the loop
+    thread's stack and counts the stall against the innermost frame that belongs to this project.
+    """
+    def __init__(self, threshold, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = LatencyTracker()
+        self.stalls = Counter()
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._reported_beat = None
+
+    def start(self):
+        """Must be called from the event loop's thread."""
+        self._loop_thread_id = threading.get_ident()
+        asyncio.create_task(self._ticker())
+        threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True).start()
+        logger.info(f"Event loop watchdog started (threshold {self.threshold * 1000:.0f} ms).")
+
+    async def _ticker(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lag.record(max(0.0, time.monotonic() - self._beat - self.interval))
+
+    def _monitor(self):
+        while True:
+            time.sleep(self.interval)
+            beat = self._beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for < self.threshold or self._reported_beat == beat: continue
+            self._reported_beat = beat  # report each stall once
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if not frame: continue
+            stack = traceback.extract_stack(frame)
+            location = self._attribute(stack)
+            self.stalls[location] += 1
+            logger.warning(f"Event loop blocked for {blocked_for * 1000:.0f} ms at {location}\n{''.join(traceback.format_list(stack[-8:]))}")
+
+    def _attribute(self, stack):
+        for entry in reversed(stack):
+            path = os.path.abspath(entry.filename)
+            if path.startswith(PROJECT_ROOT) and "site-packages" not in path and path != os.path.abspath(__file__):
+                return f"{os.path.relpath(path, PROJECT_ROOT)}:{entry.lineno} in {entry.name}"
+        entry = stack[-1]
+        return f"{entry.filename}:{entry.lineno} in {entry.name}"
+
+    def report(self, top=10):
+        lines = [f"**Loop lag:** `{self.lag.summary()}`", f"**Stalls over {self.threshold * 1000:.0f} ms:** `{sum(self.stalls.values())}`"]
+        for location, count in self.stalls.most_common(top):
+            lines.append(f"`{count}×` {location}")
+        return "\n".join(lines)
+
+watchdog = LoopWatchdog(threshold=Config.LOOP_STALL_THRESHOLD_MS / 1000)